@@ -1,54 +1,358 @@
 import os
-import shutil
+import re
+import csv
 import json
-import pandas as pd
+import shutil
+import sqlite3
+import threading
 import requests
 import logging
-from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
 from dateutil.relativedelta import relativedelta
-from gphoto import api
-from google.auth.transport.requests import Request
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler("application.log"),
-                        logging.StreamHandler()
-                    ])
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Create a logger
 logger = logging.getLogger(__name__)
 
-users_json = os.getenv('USERS', '[]')  # Default to an empty list if not set
-users = json.loads(users_json)
+destination_folder = '/app/static/pics'
+# Per-user media item index; on the credentials volume, which the web app doesn't mount,
+# so item ids and filenames aren't served alongside the pictures
+INDEX_DIR = os.getenv('GPHOTO_INDEX_DIR', '/app/credentials/gphoto-index')
+# Overridable so the pipeline can be pointed at a local stub of the API
+API_URL = os.getenv('PHOTOS_API_URL', 'https://photoslibrary.googleapis.com/v1')
+YEARS_BACK = 20
+DAYS_AHEAD = 7               # anniversaries fetched ahead of today, see anniversary_ranges
+PAGE_SIZE = 100              # mediaItems:search maximum
+RANGES_PER_SEARCH = 5        # dateFilter accepts at most 5 dates/ranges
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_QUEUE = 2 * DOWNLOAD_WORKERS
+CHUNK_SIZE = 1024 * 1024
+CSV_FIELDS = ['id', 'filename', 'mimeType', 'creationTime', 'width', 'height', 'productUrl', 'baseUrl']
 
-logger.info("Starting downloader job")
 
-destination_folder = '/app/static/pics'
-# Remove all files and recreate the directory
-shutil.rmtree(destination_folder, ignore_errors=True)
-os.makedirs(destination_folder, exist_ok=True)
-apis = {}
-creds = {}
-
-for user in users:
-    logger.info(f"Processing user: {user}")
-    apis[user] = api.GooglePhotosApi(user)
-    creds[user] = apis[user].run_local_server()
-    
+def make_session(workers=DOWNLOAD_WORKERS):
+    """One pooled session per user: keep-alive for every download thread, retries on 429/5xx."""
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=None, respect_retry_after_header=True)
+    # +1 for the search requests made from the main thread
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers + 1, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class PhotosClient:
+    """mediaItems:search with pagination and a single token refresh on 401."""
+
+    def __init__(self, session, user, creds, refresh_token, api_url=API_URL):
+        self.session = session
+        self.user = user
+        self.creds = creds
+        self.refresh_token = refresh_token
+        self.search_url = f'{api_url}/mediaItems:search'
+
+    def _post(self, payload):
+        headers = {'Authorization': f'Bearer {self.creds.token}'}
+        res = self.session.post(self.search_url, json=payload, headers=headers, timeout=60)
+        if res.status_code == 401:
+            logger.warning(f"Token expired for user: {self.user}. Attempting to refresh...")
+            if self.refresh_token(self.user):
+                headers['Authorization'] = f'Bearer {self.creds.token}'
+                res = self.session.post(self.search_url, json=payload, headers=headers, timeout=60)
+            else:
+                logger.error(f"Failed to refresh token for user: {self.user}. Skipping this request.")
+        # Raise rather than return nothing: an empty result would look like deleted items
+        res.raise_for_status()
+        return res.json()
+
+    def search(self, filters):
+        """Yield every media item matching filters, following nextPageToken to the end."""
+        payload = {'pageSize': PAGE_SIZE, 'filters': filters}
+        pages = 0
+        while True:
+            data = self._post(payload)
+            pages += 1
+            yield from data.get('mediaItems', [])
+            token = data.get('nextPageToken')
+            if not token:
+                break
+            payload['pageToken'] = token
+        logger.debug(f'Search returned {pages} page(s)')
+
+
+def _ymd(d):
+    return {'year': d.year, 'month': d.month, 'day': d.day}
+
+
+def date_filter(ranges):
+    return {'dateFilter': {'ranges': [{'startDate': _ymd(start), 'endDate': _ymd(end)} for start, end in ranges]}}
+
+
+def anniversary_ranges(today=None, years=YEARS_BACK, ahead=DAYS_AHEAD):
+    """
+    (start, end) of today and the `ahead` days after it in each of the previous
+    `years` years, oldest first. The window slides by one day a night, so a run
+    only downloads the day that just entered it and collects the one that left;
+    the price is keeping `ahead` + 1 days of anniversaries on disk instead of one.
+    """
+    today = today or date.today()
+    starts = (today - relativedelta(years=n) for n in range(years, 0, -1))
+    return [(start, start + timedelta(days=ahead)) for start in starts]
+
+
+def _in_ranges(day, ranges):
+    return any(start <= day <= end for start, end in ranges)
+
+
+def _match_day(item, ranges):
+    """The searched day an item belongs to (creationTime is UTC, the search matches local dates)."""
     try:
-        request = Request()
-        creds[user].refresh(request)
-        logger.info("Token refreshed successfully.")
-    except Exception as e:
-        logger.warning(f"Token refresh failed: {e}. Will try to get new credentials.")
-        # Remove the pickle file to force new credentials
-        pickle_file = f'/app/credentials/token_{user}_photoslibrary_v1.pickle'
-        if os.path.exists(pickle_file):
-            os.remove(pickle_file)
-        # Get new credentials
-        creds[user] = apis[user].run_local_server()
+        created = date.fromisoformat(item.get('mediaMetadata', {}).get('creationTime', '')[:10])
+    except ValueError:
+        return ranges[0][0]
+    start, end = min(ranges, key=lambda r: max(r[0] - created, created - r[1], timedelta(0)))
+    return min(max(created, start), end)
+
+
+def download_url(item):
+    return item['baseUrl'] + '=dv' if 'video' in item.get('mediaMetadata', {}) else item['baseUrl']
+
+
+def local_name(item, user):
+    name_part, extension = os.path.splitext(item['filename'])
+    return f"{name_part}_{user}{extension}"
+
+
+def download(session, item, path):
+    """Stream one item to a temp file next to path and rename it into place."""
+    tmp = f'{path}.part'
+    try:
+        with session.get(download_url(item), stream=True, timeout=(10, 120)) as response:
+            if response.status_code != 200:
+                logger.warning(f'Failed to download: {item["filename"]}, Status Code: {response.status_code}')
+                return 0
+            size = 0
+            with open(tmp, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+        os.replace(tmp, path)
+    except (requests.RequestException, OSError) as e:
+        logger.warning(f'Failed to download: {item["filename"]} ({e})')
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return 0
+    logger.debug(f'Downloaded: {os.path.basename(path)}')
+    return size
+
+
+class DownloadPool:
+    """Bounded download pool: submit() blocks once DOWNLOAD_QUEUE items are in flight."""
+
+    def __init__(self, session, workers=DOWNLOAD_WORKERS, queue=DOWNLOAD_QUEUE):
+        self.session = session
+        self.stats = {'downloaded': 0, 'failed': 0, 'bytes': 0}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(queue)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download')
+
+    def submit(self, item, path, on_done=None):
+        """Queue one download; on_done(size) runs when it finishes, with 0 for a failure."""
+        self._slots.acquire()
+        future = self._pool.submit(download, self.session, item, path)
+        future.add_done_callback(partial(self._done, on_done))
+
+    def _done(self, on_done, future):
+        self._slots.release()
+        if future.exception():
+            logger.error(f'Download worker failed: {future.exception()}')
+        size = 0 if future.exception() else future.result()
+        if on_done is not None:
+            on_done(size)
+        with self._lock:
+            if size:
+                self.stats['downloaded'] += 1
+                self.stats['bytes'] += size
+            else:
+                self.stats['failed'] += 1
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        return dict(self.stats)
+
+
+class MediaIndex:
+    """Per-user SQLite record of downloaded media items, so a run only fetches what is new or missing."""
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._claimed = {}   # local path → item id, for downloads still in flight
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " id TEXT PRIMARY KEY, filename TEXT NOT NULL, mime_type TEXT, creation_time TEXT,"
+            " local_path TEXT NOT NULL, day TEXT NOT NULL, last_seen TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS items_day ON items (day)")
+        self._db.commit()
+
+    def local_path(self, item_id):
+        with self._lock:
+            row = self._db.execute("SELECT local_path FROM items WHERE id = ?", (item_id,)).fetchone()
+        return row[0] if row else None
+
+    def seen(self, item_id, day, run):
+        with self._lock:
+            self._db.execute("UPDATE items SET day = ?, last_seen = ? WHERE id = ?", (day, run, item_id))
+
+    def claim(self, item_id, local_path):
+        """Reserve local_path for item_id, adding the id to the name if another item already has it."""
+        with self._lock:
+            row = self._db.execute("SELECT id FROM items WHERE local_path = ?", (local_path,)).fetchone()
+            owner = self._claimed.get(local_path) or (row[0] if row else None)
+            if owner not in (None, item_id):
+                stem, ext = os.path.splitext(local_path)
+                suffix = re.sub(r'[^\w-]', '', item_id)[-8:]
+                local_path = f"{stem}_{suffix}{ext}"
+            self._claimed[local_path] = item_id
+        return local_path
+
+    def store(self, item, local_path, day, run):
+        meta = item.get('mediaMetadata', {})
+        with self._lock:
+            self._claimed.pop(local_path, None)
+            self._db.execute(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item['id'], item['filename'], item.get('mimeType'), meta.get('creationTime'), local_path, day, run),
+            )
+            self._db.commit()
+
+    def release(self, local_path):
+        with self._lock:
+            self._claimed.pop(local_path, None)
+
+    def items(self):
+        """[(id, local_path, day)] for every indexed item."""
+        with self._lock:
+            return self._db.execute("SELECT id, local_path, day FROM items").fetchall()
+
+    def remove(self, item_id):
+        with self._lock:
+            self._db.execute("DELETE FROM items WHERE id = ?", (item_id,))
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+def collect_garbage(index, destination, ranges, searched_ranges, seen_ids):
+    """
+    Keep only the anniversary window: remove this user's indexed items whose
+    day has left ranges, those gone from Google Photos (their day was searched
+    this run but they weren't returned), and forget rows whose file was deleted
+    locally. Only paths in this user's own index are touched.
+    """
+    removed = 0
+    for item_id, local_path, day in index.items():
+        path = os.path.join(destination, local_path)
+        day = date.fromisoformat(day)
+        if not _in_ranges(day, ranges) or (_in_ranges(day, searched_ranges) and item_id not in seen_ids):
+            for leftover in (path, path + '.part'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            index.remove(item_id)
+            removed += 1
+            folder = os.path.dirname(path)
+            if os.path.isdir(folder) and not any(os.scandir(folder)):
+                os.rmdir(folder)
+        elif item_id not in seen_ids and not os.path.exists(path):
+            index.remove(item_id)
+    return removed
+
+
+def sync_user(user, creds, refresh_token, destination=destination_folder, ranges=None, api_url=API_URL,
+              csv_path=None, index_dir=INDEX_DIR):
+    """
+    Bring destination up to date for the anniversary window: search its ranges
+    RANGES_PER_SEARCH at a time, download only items the index doesn't already
+    have on disk, then garbage-collect items deleted upstream.
+    """
+    ranges = ranges or anniversary_ranges()
+    logger.info(f"Date ranges to fetch: {[f'{start}..{end}' for start, end in ranges]}")
+    run = datetime.now().isoformat(timespec='seconds')
+    csv_path = csv_path or f'item-list-{user}-{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    os.makedirs(destination, exist_ok=True)
+    index = MediaIndex(os.path.join(index_dir, f'{user}.sqlite'))
+    seen, searched, present = set(), [], 0
+
+    def record(item, local_path, day, size):
+        if size:
+            index.store(item, local_path, day, run)
+        else:
+            index.release(local_path)
+
+    try:
+        with make_session() as session, open(csv_path, 'w', newline='') as csv_file:
+            client = PhotosClient(session, user, creds, refresh_token, api_url)
+            writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            pool = DownloadPool(session)
+            try:
+                for start in range(0, len(ranges), RANGES_PER_SEARCH):
+                    batch = ranges[start:start + RANGES_PER_SEARCH]
+                    try:
+                        for item in client.search(date_filter(batch)):
+                            day = _match_day(item, batch)
+                            seen.add(item['id'])
+                            writer.writerow({**item, **item.get('mediaMetadata', {})})
+                            local_path = index.local_path(item['id'])
+                            if local_path and os.path.exists(os.path.join(destination, local_path)):
+                                index.seen(item['id'], day.isoformat(), run)
+                                present += 1
+                                continue
+                            local_path = index.claim(item['id'], local_path or f'{day.year}/{local_name(item, user)}')
+                            os.makedirs(os.path.join(destination, os.path.dirname(local_path)), exist_ok=True)
+                            pool.submit(item, os.path.join(destination, local_path),
+                                        partial(record, item, local_path, day.isoformat()))
+                    except (requests.RequestException, ValueError) as e:
+                        # Not marked searched, so nothing in these ranges is garbage-collected
+                        logger.error(f"Search failed for ranges {[f'{start}..{end}' for start, end in batch]}: {e}")
+                        continue
+                    searched.extend(batch)
+            finally:
+                stats = pool.close()
+        stats['present'] = present
+        stats['removed'] = collect_garbage(index, destination, ranges, searched, seen)
+    finally:
+        index.close()
+    logger.info(f"User {user}: {len(seen)} items found, {stats['present']} already present, "
+                f"{stats['downloaded']} downloaded ({stats['bytes'] / 1024**2:.1f} MB), {stats['failed']} failed, "
+                f"{stats['removed']} removed. Saved media items to {csv_path}")
+    return stats
+
+
+def main():
+    from gphoto import api
+    from google.auth.transport.requests import Request
+
+    users_json = os.getenv('USERS', '[]')  # Default to an empty list if not set
+    users = json.loads(users_json)
+
+    logger.info("Starting downloader job")
+    if not os.path.isdir(INDEX_DIR) and os.path.isdir(destination_folder):
+        # Pictures from before the index existed are tracked by no one; start clean once,
+        # as every run used to
+        shutil.rmtree(destination_folder)
+
+    apis = {}
+    creds = {}
 
     def refresh_token(user):
         try:
@@ -60,96 +364,37 @@ for user in users:
             logger.error(f"Error refreshing token for user {user}: {e}")
             return False
 
-    # --- End of Token Refresh Logic ---
-
-    def get_response_from_google_photos_api(year, month, day):
-        photo_url = 'https://photoslibrary.googleapis.com/v1/mediaItems:search'
-        payload = {
-            "filters": {
-                "dateFilter": {
-                    "ranges": [
-                        {
-                            "startDate": {"year": year, "month": month, "day": day},
-                            "endDate": {"year": year, "month": month, "day": day}
-                        }
-                    ]
-                }
-            }
-        }
-        headers = {
-            'content-type': 'application/json',
-            'Authorization': f'Bearer {creds[user].token}'
-        }
-
-        try:
-            res = requests.post(photo_url, json=payload, headers=headers)
-            logger.debug(f"Response Raw: {res.raw}")
-            if res.status_code == 401:
-                logger.warning(f"Token expired for user: {user}. Attempting to refresh...")
-                if refresh_token(user):
-                    headers['Authorization'] = f'Bearer {creds[user].token}'
-                    res = requests.post(photo_url, json=payload, headers=headers)
-                else:
-                    logger.error(f"Failed to refresh token for user: {user}. Skipping this request.")
-                    return None
-        except Exception as e:
-            logger.error(f'Request error: {e}')
-            return None
-
-        return res
-
-    def list_of_media_items(year, month, day, media_items_df):
-        items_list_df = pd.DataFrame()
-
-        response = get_response_from_google_photos_api(year, month, day)
-        if response is None:
-            return pd.DataFrame(), media_items_df
+    for user in users:
+        logger.info(f"Processing user: {user}")
+        apis[user] = api.GooglePhotosApi(user)
+        creds[user] = apis[user].run_local_server()
 
         try:
-            logger.debug(f'Received data: {response.json()}')
-            for item in response.json().get('mediaItems', []):
-                item_data = pd.DataFrame([item])
-                items_list_df = pd.concat([items_list_df, item_data], ignore_index=True)
-                media_items_df = pd.concat([media_items_df, item_data], ignore_index=True)
+            request = Request()
+            creds[user].refresh(request)
+            logger.info("Token refreshed successfully.")
         except Exception as e:
-            logger.error(f'Error processing response: {e}')
-
-        return items_list_df, media_items_df
+            logger.warning(f"Token refresh failed: {e}. Will try to get new credentials.")
+            # Remove the pickle file to force new credentials
+            pickle_file = f'/app/credentials/token_{user}_photoslibrary_v1.pickle'
+            if os.path.exists(pickle_file):
+                os.remove(pickle_file)
+            # Get new credentials
+            creds[user] = apis[user].run_local_server()
 
-    # Create a list with all dates between start date and today
-    date_list = pd.date_range(date.today() - relativedelta(years=20), periods=20, freq=pd.DateOffset(years=1))
-    logger.info(f"Dates list to fetch: {date_list}")
-    media_items_df_init = pd.DataFrame()
-    for single_date in date_list:
-        items_df, media_items_df = list_of_media_items(year=single_date.year, month=single_date.month,
-                                                       day=single_date.day, media_items_df=media_items_df_init)
+        # --- End of Token Refresh Logic ---
 
-        if not items_df.empty:
-            for index, item in items_df.iterrows():
-                url = item['baseUrl'] + '=dv' if 'video' in item.get('mediaMetadata', {}) else item['baseUrl']
-                response = requests.get(url)
+        sync_user(user, creds[user], refresh_token)
 
-                if response.status_code == 200:
-                    name_part, extension = item['filename'].rsplit('.', 1)
-                    file_name = f"{name_part}_{user}.{extension}"
-                    year_folder = os.path.join(destination_folder, str(single_date.year))
-                    os.makedirs(year_folder, exist_ok=True)
-
-                    with open(os.path.join(year_folder, file_name), 'wb') as f:
-                        f.write(response.content)
-
-                    logger.debug(f'Downloaded: {file_name}')
-                else:
-                    logger.warning(f'Failed to download: {item["filename"]}, Status Code: {response.status_code}')
-
-            logger.info(f'Downloaded items for date: {single_date.year}/{single_date.month}/{single_date.day}')
-        else:
-            logger.info(f'No media items found for date: {single_date.year}/{single_date.month}/{single_date.day}')
+    logger.info("Cycle is done")
 
-    # Save a list of all media items to a csv file
-    current_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f'item-list-{current_datetime}.csv'
-    media_items_df_init.to_csv(filename, index=False)
-    logger.info(f"Saved media items to {filename}")
 
-logger.info("Cycle is done")
\ No newline at end of file
+if __name__ == '__main__':
+    # Configure logging
+    logging.basicConfig(level=logging.DEBUG,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        handlers=[
+                            logging.FileHandler("application.log"),
+                            logging.StreamHandler()
+                        ])
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Audit PROCESSING_PATH against the ingest manifests in .manifests/.
+
+For every manifest entry (v1: member → dest string; v2: {dest, size, sha256, …})
+the destination must exist, have the recorded size and — where a hash is
+known — the recorded SHA-256. Files moved by categorize_unknowns.py are
+followed through the change journal's "moved" records; anything still missing
+is looked for by size + hash among the files no manifest mentions.
+
+Hashing is the expensive part, so:
+  * a verify-cache (.audit/verify.sqlite) keyed on path, size and mtime_ns
+    remembers every hash; an unchanged file is never read twice, so weekly
+    audits only read what changed since the last one
+  * files are read in inode order (close to on-disk order on ext4), on
+    AUDIT_WORKERS threads, throttled to MAX_MB_PER_S, with fadvise hints so
+    the audit doesn't flush the web app's page cache
+  * v1 entries have no recorded hash: their first audited hash becomes the
+    baseline, and a later mismatch on the same path is reported as changed
+
+Report categories: missing, size_mismatch, changed, moved (found elsewhere),
+unmanifested. A JSON report lands in .audit/; the exit status is 1 when
+anything other than moved/unmanifested turned up.
+
+  python3 audit_library.py                 # incremental audit
+  python3 audit_library.py --no-hash       # presence + size only
+  python3 audit_library.py --full          # ignore the verify-cache
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+
+from change_journal import read as read_changes
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+PROCESSING_PATH = "/other_hdd/google_phots_all_take_for_processing"
+
+AUDIT_WORKERS = 2
+MAX_MB_PER_S  = 80
+HASH_BUFSIZE  = 1024 * 1024
+
+# Same set as google_takeout_processor.py
+MEDIA_EXTS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp", ".heic", ".heif",
+              ".mp4", ".mov", ".avi", ".mkv", ".m4v", ".3gp"}
+
+
+# ---------------------------------------------------------------------------
+# Inputs: manifests, journalled moves, the library itself
+# ---------------------------------------------------------------------------
+
+def load_manifests(manifest_dir: str) -> dict:
+    """{dest: {"size", "sha256", "refs": [(archive, member)]}} across v1 and v2 manifests."""
+    expected = {}
+    for mf in sorted(glob.glob(os.path.join(manifest_dir, "*.json"))):
+        try:
+            with open(mf, encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as exc:
+            logger.warning("Skipping manifest %s (%s: %s).", mf, type(exc).__name__, exc)
+            continue
+        archive = data.get("archive", os.path.basename(mf))
+        for member, entry in data.get("files", {}).items():
+            if isinstance(entry, str):  # v1
+                entry = {"dest": entry}
+            e = expected.setdefault(entry["dest"], {"size": None, "sha256": None, "refs": []})
+            e["size"] = entry.get("size", e["size"])
+            e["sha256"] = entry.get("sha256", e["sha256"])
+            e["refs"].append((archive, member))
+    return expected
+
+
+def journal_moves(changes_dir: str) -> dict:
+    """{old rel path: new rel path} from every "moved" record still in the change journal."""
+    moves = {}
+    for _pos, rec in read_changes(changes_dir):
+        if rec.get("kind") == "moved" and rec.get("from"):
+            moves[rec["from"]] = f"{rec['dir']}/{rec['name']}"
+    return moves
+
+
+def _follow(path: str, moves: dict) -> str:
+    seen = set()
+    while path in moves and path not in seen:
+        seen.add(path)
+        path = moves[path]
+    return path
+
+
+def library_files(root: str) -> dict:
+    """{rel path: os.stat_result} for every media file in a date folder."""
+    files = {}
+    for entry in os.scandir(root):
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+        for f in os.scandir(entry.path):
+            if f.is_file() and os.path.splitext(f.name.lower())[1] in MEDIA_EXTS:
+                files[f"{entry.name}/{f.name}"] = f.stat()
+    return files
+
+
+# ---------------------------------------------------------------------------
+# Hashing: verify-cache, throttle, ordered parallel reads
+# ---------------------------------------------------------------------------
+
+class VerifyCache:
+    """path → (size, mtime_ns, sha256) from earlier audits. Thread-safe."""
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS verified ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL, verified_at INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+    def lookup(self, rel: str, st: os.stat_result) -> str | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256 FROM verified WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (rel, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+        return row[0] if row else None
+
+    def previous(self, rel: str) -> str | None:
+        """Last hash recorded for this path, whatever its size/mtime were then."""
+        with self._lock:
+            row = self._db.execute("SELECT sha256 FROM verified WHERE path = ?", (rel,)).fetchone()
+        return row[0] if row else None
+
+    def store(self, rel: str, st: os.stat_result, digest: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO verified VALUES (?, ?, ?, ?, ?)",
+                (rel, st.st_size, st.st_mtime_ns, digest, int(time.time())),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+class Throttle:
+    """Token bucket shared by the hashing threads (bytes per second)."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def consume(self, nbytes: int) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next = max(self._next, now) + nbytes / self.rate
+            delay = self._next - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _hash(path: str, throttle: Throttle) -> str:
+    h = hashlib.sha256()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while chunk := os.read(fd, HASH_BUFSIZE):
+            throttle.consume(len(chunk))
+            h.update(chunk)
+        # Don't leave the library in the page cache at the web app's expense
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return h.hexdigest()
+
+
+def hash_files(root: str, todo: dict, cache: VerifyCache, throttle: Throttle, workers: int,
+               stats: dict, use_cache: bool = True) -> dict:
+    """{rel: sha256} for todo {rel: stat}, from the cache where possible, else read in inode order."""
+    digests, to_read = {}, []
+    for rel, st in todo.items():
+        cached = cache.lookup(rel, st) if use_cache else None
+        if cached:
+            digests[rel] = cached
+            stats["cache_hits"] += 1
+        else:
+            to_read.append((st.st_ino, rel, st))
+    to_read.sort()
+    total = sum(st.st_size for _ino, _rel, st in to_read)
+    logger.info("Hashing %d file(s), %.1f GB (%d from cache)…", len(to_read), total / 1024**3, len(digests))
+
+    def work(item):
+        _ino, rel, st = item
+        return rel, st, _hash(os.path.join(root, rel), throttle)
+
+    done_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, result in enumerate(pool.map(_safe(work), to_read), 1):
+            if result is None:
+                continue
+            rel, st, digest = result
+            cache.store(rel, st, digest)
+            digests[rel] = digest
+            done_bytes += st.st_size
+            stats["hashed"] += 1
+            stats["bytes_hashed"] += st.st_size
+            if i % 1000 == 0:
+                logger.info("  Hashed %d/%d (%.1f%% of bytes)", i, len(to_read), done_bytes / max(total, 1) * 100)
+    return digests
+
+
+def _safe(fn):
+    def wrapped(item):
+        try:
+            return fn(item)
+        except OSError as exc:
+            logger.warning("Could not read %s (%s).", item[1], exc)
+            return None
+    return wrapped
+
+
+# ---------------------------------------------------------------------------
+# Audit
+# ---------------------------------------------------------------------------
+
+def audit(root: str, do_hash: bool = True, full: bool = False, workers: int = AUDIT_WORKERS,
+          max_mb_per_s: float = MAX_MB_PER_S) -> dict:
+    t0 = time.monotonic()
+    expected = load_manifests(os.path.join(root, ".manifests"))
+    moves = journal_moves(os.path.join(root, ".changes"))
+    on_disk = library_files(root)
+    logger.info("%d manifest destination(s), %d media file(s) on disk, %d journalled move(s).",
+                len(expected), len(on_disk), len(moves))
+
+    report = defaultdict(list)
+    stats = {"cache_hits": 0, "hashed": 0, "bytes_hashed": 0}
+    present = {}   # current rel path → manifest dest it stands for
+    accounted = set()  # every on-disk path claimed by a manifest entry, good or not
+    for dest, e in expected.items():
+        now = dest if dest in on_disk else _follow(dest, moves)
+        if now not in on_disk:
+            report["missing"].append({"dest": dest, "refs": e["refs"][:3]})
+            continue
+        accounted.add(now)
+        if now != dest:
+            report["moved"].append({"dest": dest, "now": now, "via": "journal"})
+        if e["size"] is not None and on_disk[now].st_size != e["size"]:
+            report["size_mismatch"].append({"dest": now, "expected": e["size"], "actual": on_disk[now].st_size})
+            continue
+        present[now] = dest
+
+    # A size mismatch is reported as such, not again as unmanifested or as a relocation candidate
+    unmanifested = {rel: st for rel, st in on_disk.items() if rel not in accounted}
+
+    if do_hash:
+        cache = VerifyCache(os.path.join(root, ".audit", "verify.sqlite"))
+        throttle = Throttle(max_mb_per_s * 1024 * 1024)
+        try:
+            # Previous hashes are the baseline for entries without a manifest hash
+            baseline = {rel: cache.previous(rel) for rel, dest in present.items()
+                        if not expected[dest]["sha256"]}
+            digests = hash_files(root, {rel: on_disk[rel] for rel in present}, cache, throttle, workers,
+                                 stats, use_cache=not full)
+            for rel, dest in present.items():
+                want = expected[dest]["sha256"] or baseline.get(rel)
+                got = digests.get(rel)
+                if want and got and got != want:
+                    report["changed"].append({"dest": rel, "expected": want, "actual": got})
+
+            # Missing files may simply live elsewhere now: same size, same hash
+            missing = {m["dest"] for m in report["missing"]}
+            lost = {expected[dest]["sha256"]: dest for dest in missing if expected[dest]["sha256"]}
+            lost_sizes = {expected[dest]["size"] for dest in lost.values()}
+            candidates = {rel: st for rel, st in unmanifested.items() if st.st_size in lost_sizes}
+            if lost and candidates:
+                found = hash_files(root, candidates, cache, throttle, workers, stats)
+                for rel, digest in found.items():
+                    dest = lost.pop(digest, None)
+                    if dest:
+                        report["moved"].append({"dest": dest, "now": rel, "via": "hash"})
+                        unmanifested.pop(rel)
+                found_dests = {m["dest"] for m in report["moved"] if m["via"] == "hash"}
+                report["missing"] = [m for m in report["missing"] if m["dest"] not in found_dests]
+        finally:
+            cache.close()
+
+    report["unmanifested"] = sorted(unmanifested)
+    result = {
+        "root": root,
+        "finished": datetime.now().isoformat(timespec="seconds"),
+        "seconds": round(time.monotonic() - t0, 1),
+        "manifest_entries": len(expected),
+        "files_on_disk": len(on_disk),
+        **stats,
+        "counts": {k: len(report[k]) for k in ("missing", "size_mismatch", "changed", "moved", "unmanifested")},
+        **{k: report[k] for k in ("missing", "size_mismatch", "changed", "moved", "unmanifested")},
+    }
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the organised library against the ingest manifests.")
+    parser.add_argument("--root", default=PROCESSING_PATH)
+    parser.add_argument("--no-hash", action="store_true", help="presence and size only")
+    parser.add_argument("--full", action="store_true", help="re-hash everything, ignoring the verify-cache")
+    parser.add_argument("--workers", type=int, default=AUDIT_WORKERS)
+    parser.add_argument("--max-mb-per-s", type=float, default=MAX_MB_PER_S, help="read throttle (0 = none)")
+    args = parser.parse_args()
+
+    result = audit(args.root, not args.no_hash, args.full, args.workers, args.max_mb_per_s)
+    out_dir = os.path.join(args.root, ".audit")
+    os.makedirs(out_dir, exist_ok=True)
+    report_path = os.path.join(out_dir, f"report-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    logger.info("Audit finished in %.1fs: %s", result["seconds"], result["counts"])
+    logger.info("Hashed %d file(s) (%.1f GB), %d verify-cache hit(s).",
+                result["hashed"], result["bytes_hashed"] / 1024**3, result["cache_hits"])
+    for kind in ("missing", "size_mismatch", "changed"):
+        for item in result[kind][:20]:
+            logger.warning("  %-13s %s", kind, item["dest"])
+    logger.info("Report: %s", report_path)
+    sys.exit(1 if any(result["counts"][k] for k in ("missing", "size_mismatch", "changed")) else 0)
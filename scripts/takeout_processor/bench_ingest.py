@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Ingest benchmark for google_takeout_processor.py on synthetic Takeouts.
+
+Generates (or reuses) a synth_takeout.py data set under WORK/in, runs the
+processor in a child process against WORK/out with every path redirected
+there, and reports:
+
+  wall time and MB/s      uncompressed media bytes / wall-clock seconds
+  peak temp disk          highest disk usage above the final output size
+                          (extract tree, .part files) — sampled, same filesystem
+  peak RSS                VmHWM of the processor process (sampled from /proc)
+  date accuracy           manifest date folder vs truth.json, per kind and
+                          per date method
+
+  python3 bench_ingest.py /tmp/bench --archives 3 --files 2000 --mode stream
+  python3 bench_ingest.py /tmp/bench --reuse --mode extract --json result.json
+
+Nothing outside WORK is touched (the processor's log goes to WORK/processor.log);
+--reuse keeps the generated archives so several modes/settings can be compared
+on identical input.
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from collections import defaultdict
+
+import synth_takeout
+
+SAMPLE_INTERVAL = 0.2
+
+
+def _configure(gtp, work: str, mode: str, parallel: int) -> None:
+    """Point every path the processor writes to inside WORK."""
+    out = os.path.join(work, "out")
+    gtp.TAKEOUT_PATH     = os.path.join(work, "in")
+    gtp.PROCESSING_PATH  = out
+    gtp.MANIFEST_DIR     = os.path.join(out, ".manifests")
+    gtp.JOURNAL_DIR      = os.path.join(out, ".progress")
+    gtp.CHANGES_DIR      = os.path.join(out, ".changes")
+    gtp.THUMB_CACHE_DIR  = os.path.join(out, ".thumb_cache")
+    gtp.STAGING_DIR      = os.path.join(out, ".staging")
+    gtp.STATE_FILE       = os.path.join(work, "processed_archives.json")
+    gtp.METRICS_TEXTFILE = os.path.join(work, "metrics.prom")
+    gtp.INGEST_MODE       = mode
+    gtp.PARALLEL_ARCHIVES = parallel
+    # Synthetic payloads aren't decodable images
+    gtp.INGEST_THUMBNAILS = False
+
+
+def _child(work: str, mode: str, parallel: int) -> None:
+    import google_takeout_processor as gtp
+    gtp._setup_logging()
+    _configure(gtp, work, mode, parallel)
+    gtp.main()
+
+
+def _hwm_kb(pid: int) -> int:
+    """
+    Peak RSS of a live process. ru_maxrss of children is no good here: Linux
+    carries the parent's high-water mark across fork+exec, so it would report
+    the generator's footprint rather than the processor's.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _sample(proc: subprocess.Popen, path: str, baseline: int, stop: threading.Event, peak: dict) -> None:
+    while not stop.wait(SAMPLE_INTERVAL):
+        peak["disk"] = max(peak["disk"], shutil.disk_usage(path).used - baseline)
+        peak["rss_kb"] = max(peak["rss_kb"], _hwm_kb(proc.pid))
+
+
+def _score(work: str, truth: dict) -> dict:
+    """Compare every manifest entry's date folder with the generator's truth."""
+    by_kind = defaultdict(lambda: {"total": 0, "correct": 0, "methods": defaultdict(int)})
+    by_method = defaultdict(lambda: {"total": 0, "correct": 0})
+    for mf in glob.glob(os.path.join(work, "out", ".manifests", "*.json")):
+        with open(mf, encoding="utf-8") as f:
+            data = json.load(f)
+        for member, entry in data.get("files", {}).items():
+            t = truth.get(f"{data['archive']}::{member}")
+            if t is None:
+                continue
+            folder = entry["dest"].split("/", 1)[0]
+            ok = folder == t["date"]
+            k, m = by_kind[t["kind"]], by_method[entry["method"]]
+            k["total"] += 1
+            k["correct"] += ok
+            k["methods"][entry["method"]] += 1
+            m["total"] += 1
+            m["correct"] += ok
+    placed = sum(k["total"] for k in by_kind.values())
+    return {
+        "members": len(truth),
+        "placed": placed,
+        "missing": len(truth) - placed,
+        "correct": sum(k["correct"] for k in by_kind.values()),
+        "by_kind": {k: {**v, "methods": dict(v["methods"])} for k, v in sorted(by_kind.items())},
+        "by_method": dict(sorted(by_method.items())),
+    }
+
+
+def run(work: str, mode: str, parallel: int, truth: dict, input_bytes: int) -> dict:
+    out = os.path.join(work, "out")
+    shutil.rmtree(out, ignore_errors=True)
+    for leftover in glob.glob(os.path.join(work, "in", "temp_extract_*")):
+        shutil.rmtree(leftover, ignore_errors=True)
+    state = os.path.join(work, "processed_archives.json")
+    if os.path.exists(state):
+        os.remove(state)
+    os.makedirs(out)
+
+    baseline = shutil.disk_usage(work).used
+    peak, stop = {"disk": 0, "rss_kb": 0}, threading.Event()
+    t0 = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--child", work, "--mode", mode,
+         "--parallel", str(parallel)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        env={**os.environ, "TAKEOUT_PROCESSOR_LOG": os.path.join(work, "processor.log")},
+    )
+    sampler = threading.Thread(target=_sample, args=(proc, work, baseline, stop, peak), daemon=True)
+    sampler.start()
+    _, stderr = proc.communicate()
+    wall = time.monotonic() - t0
+    stop.set()
+    sampler.join()
+    final = shutil.disk_usage(work).used - baseline
+    if proc.returncode != 0:
+        sys.stderr.write(stderr[-4000:])
+        raise SystemExit(f"processor exited with {proc.returncode}")
+
+    result = {
+        "mode": mode,
+        "parallel": parallel,
+        "wall_seconds": round(wall, 2),
+        "input_mb": round(input_bytes / 1024**2, 1),
+        "mb_per_second": round(input_bytes / 1024**2 / wall, 1),
+        "files_per_second": round(len(truth) / wall, 1),
+        "peak_temp_disk_mb": round(max(peak["disk"] - final, 0) / 1024**2, 1),
+        "output_disk_mb": round(final / 1024**2, 1),
+        "peak_rss_mb": round(peak["rss_kb"] / 1024, 1),
+    }
+    result["accuracy"] = _score(work, truth)
+    return result
+
+
+def _print_report(r: dict) -> None:
+    acc = r["accuracy"]
+    print(f"mode={r['mode']} parallel={r['parallel']}")
+    print(f"  wall            {r['wall_seconds']:.2f}s")
+    print(f"  throughput      {r['mb_per_second']:.1f} MB/s, {r['files_per_second']:.1f} files/s "
+          f"({r['input_mb']:.1f} MB input)")
+    print(f"  peak temp disk  {r['peak_temp_disk_mb']:.1f} MB (output {r['output_disk_mb']:.1f} MB)")
+    print(f"  peak RSS        {r['peak_rss_mb']:.1f} MB")
+    print(f"  date accuracy   {acc['correct']}/{acc['members']} "
+          f"({acc['correct'] / max(acc['members'], 1):.1%}), {acc['missing']} not placed")
+    print(f"  {'kind':<11} {'n':>6} {'correct':>8}  methods")
+    for kind, k in acc["by_kind"].items():
+        methods = ", ".join(f"{m}={n}" for m, n in sorted(k["methods"].items()))
+        print(f"  {kind:<11} {k['total']:>6} {k['correct'] / k['total']:>8.1%}  {methods}")
+    print(f"  {'method':<11} {'n':>6} {'correct':>8}")
+    for method, m in acc["by_method"].items():
+        print(f"  {method:<11} {m['total']:>6} {m['correct'] / m['total']:>8.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the takeout processor on synthetic archives.")
+    parser.add_argument("work", help="scratch directory (created; in/ and out/ live here)")
+    parser.add_argument("--mode", choices=("stream", "extract"), default="stream")
+    parser.add_argument("--parallel", type=int, default=1, help="PARALLEL_ARCHIVES")
+    parser.add_argument("--archives", type=int, default=2)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--photo-kb", type=int, default=2500)
+    parser.add_argument("--video-kb", type=int, default=20000)
+    parser.add_argument("--reuse", action="store_true", help="keep WORK/in from an earlier run")
+    parser.add_argument("--json", help="also write the result to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.work, args.mode, args.parallel)
+        sys.exit(0)
+
+    in_dir = os.path.join(args.work, "in")
+    truth_path = os.path.join(in_dir, "truth.json")
+    if args.reuse and os.path.exists(truth_path):
+        with open(truth_path, encoding="utf-8") as f:
+            truth = json.load(f)
+    else:
+        shutil.rmtree(in_dir, ignore_errors=True)
+        print(f"Generating {args.archives} archive(s) with {args.files} media members…")
+        truth = synth_takeout.generate(in_dir, args.archives, args.files, args.seed,
+                                       args.photo_kb, args.video_kb)
+
+    input_bytes = 0
+    for zip_path in glob.glob(os.path.join(in_dir, "*.zip")):
+        with zipfile.ZipFile(zip_path) as zf:
+            input_bytes += sum(i.file_size for i in zf.infolist()
+                               if f"{os.path.basename(zip_path)}::{i.filename}" in truth)
+
+    result = run(args.work, args.mode, args.parallel, truth, input_bytes)
+    _print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
@@ -1,24 +1,54 @@
 #!/usr/bin/env python3
+"""
+Move files out of PROCESSING_PATH/unknown_date into date folders.
+
+Files are handled in chunks of CHUNK_SIZE so memory stays bounded and every
+chunk is moved before the next is read — a killed run just leaves the
+remaining files in unknown_date, and rerunning picks up where it stopped.
+
+Per chunk:
+  1. header_dates.py reads JPEG/HEIC Exif and MP4/MOV mvhd dates in-process
+     on a thread pool (covers most files without spawning anything)
+  2. whatever is left goes to persistent `exiftool -stay_open` sessions, one
+     per worker, in batches of EXIFTOOL_BATCH
+  3. filesystem mtime as the last resort
+
+Every move is appended to the library change journal (change_journal.py) as a
+"moved" record, so downstream consumers see it without rescanning, and the
+dedup index (dedup_index.py), if the library has one, follows the file to its
+new path.
+"""
 import os
 import json
 import shutil
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import logging
 
+from change_journal import ChangeJournal
+from dedup_index import DedupIndex
+from header_dates import date_from_file
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 PROCESSING_PATH = "/other_hdd/google_phots_all_take_for_processing"
 UNKNOWN_DIR = os.path.join(PROCESSING_PATH, "unknown_date")
 
+CHUNK_SIZE = 500
+WORKERS = 4
+EXIFTOOL_BATCH = 100
+DEDUP_DB = os.path.join(PROCESSING_PATH, ".dedup", "index.sqlite")
+
 def _unique_dest(dest_path_str: str) -> str:
     """If file exists, append _1, _2 etc to stem."""
     p = Path(dest_path_str)
     if not p.exists():
         return dest_path_str
-    
+
     stem = p.stem
     ext = p.suffix
     directory = p.parent
@@ -30,81 +60,173 @@ def _unique_dest(dest_path_str: str) -> str:
             return str(new_path)
         counter += 1
 
+
+class ExifTool:
+    """One `exiftool -stay_open` process: pay the Perl start-up cost once, not per call."""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            ["exiftool", "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8",
+        )
+
+    def dates(self, paths: list) -> dict:
+        """{SourceFile: {DateTimeOriginal, CreateDate}} for one batch of files."""
+        args = ["-json", "-DateTimeOriginal", "-CreateDate", *paths, "-execute"]
+        self.proc.stdin.write("\n".join(args) + "\n")
+        self.proc.stdin.flush()
+        lines = []
+        for line in self.proc.stdout:
+            if line.strip() == "{ready}":
+                break
+            lines.append(line)
+        out = "".join(lines).strip()
+        return {item.get('SourceFile'): item for item in json.loads(out)} if out else {}
+
+    def close(self):
+        try:
+            self.proc.stdin.write("-stay_open\nFalse\n")
+            self.proc.stdin.flush()
+            self.proc.wait(timeout=10)
+        except Exception:
+            self.proc.kill()
+
+
+class ExifToolPool:
+    """Thread-local ExifTool sessions; disables itself if exiftool isn't installed."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self.available = True
+
+    def dates(self, paths: list) -> dict:
+        if not self.available:
+            return {}
+        session = getattr(self._local, "session", None)
+        if session is None:
+            try:
+                session = ExifTool()
+            except FileNotFoundError:
+                logger.error("exiftool not found – falling back to mtime for files without header dates.")
+                self.available = False
+                return {}
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        try:
+            return session.dates(paths)
+        except Exception as e:
+            logger.error(f"exiftool batch of {len(paths)} failed: {e}")
+            self._local.session = None
+            session.close()
+            return {}
+
+    def close(self):
+        for session in self._sessions:
+            session.close()
+
+
+def _exiftool_date(meta: dict):
+    """ExifTool formats dates like "2024:05:01 12:34:56"."""
+    for tag in ['DateTimeOriginal', 'CreateDate']:
+        val = meta.get(tag)
+        if val and len(val) >= 10:
+            # Replace colons in the date part (first 10 chars) with underscores
+            d_part = val[:10].replace(':', '_')
+            if len(d_part) == 10 and d_part.count('_') == 2:
+                return d_part, f"exif_{tag.lower()}"
+    return None, None
+
+
+def _mtime_date(file_path: str) -> str:
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y_%m_%d")
+    except Exception as e:
+        logger.error(f"Could not get mtime for {file_path}: {e}")
+        return "1970_01_01"
+
+
+def _resolve_chunk(paths: list, pool: ThreadPoolExecutor, exiftool: ExifToolPool, source_counts: dict):
+    """Yield (file_path, date_str, method) for one chunk, header reader first."""
+    unresolved = []
+    for file_path, (date_str, tag) in zip(paths, pool.map(date_from_file, paths)):
+        if date_str:
+            source_counts['header'] += 1
+            yield file_path, date_str, f"exif_{tag.lower()}"
+        else:
+            unresolved.append(file_path)
+
+    batches = [unresolved[i:i + EXIFTOOL_BATCH] for i in range(0, len(unresolved), EXIFTOOL_BATCH)]
+    for batch, metadata_map in zip(batches, pool.map(exiftool.dates, batches)):
+        for file_path in batch:
+            date_str, method = _exiftool_date(metadata_map.get(file_path, {}))
+            if date_str:
+                source_counts['exiftool'] += 1
+            else:
+                # Fallback to filesystem mtime
+                date_str, method = _mtime_date(file_path), 'fallback_mtime'
+            yield file_path, date_str, method
+
+
 def main():
     if not os.path.exists(UNKNOWN_DIR):
         logger.info(f"Directory {UNKNOWN_DIR} does not exist. Nothing to do.")
         return
 
-    files = [os.path.join(UNKNOWN_DIR, f) for f in os.listdir(UNKNOWN_DIR) if os.path.isfile(os.path.join(UNKNOWN_DIR, f))]
+    # Snapshot names only — we move files out of the directory as we go
+    files = [e.path for e in os.scandir(UNKNOWN_DIR) if e.is_file() and not e.name.endswith('.part')]
     total_files = len(files)
-    logger.info(f"Found {total_files} files in {UNKNOWN_DIR}. Running exiftool...")
+    logger.info(f"Found {total_files} files in {UNKNOWN_DIR}. Processing in chunks of {CHUNK_SIZE}...")
 
     if total_files == 0:
         return
 
-    # Run exiftool on the directory
-    # -json: output JSON
-    # -DateTimeOriginal -CreateDate: Only extract these to save memory and time
-    # -q: quiet
-    cmd = ["exiftool", "-json", "-DateTimeOriginal", "-CreateDate", UNKNOWN_DIR]
-    try:
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        metadata_list = json.loads(result.stdout)
-    except Exception as e:
-        logger.error(f"Failed to run exiftool or parse output: {e}")
-        metadata_list = []
-
-    # Map filename to metadata dict
-    metadata_map = {item.get('SourceFile'): item for item in metadata_list}
-
     processed = 0
     method_counts = {'exif_datetimeoriginal': 0, 'exif_createdate': 0, 'fallback_mtime': 0}
+    source_counts = {'header': 0, 'exiftool': 0}
+    exiftool = ExifToolPool()
+    changes = ChangeJournal(PROCESSING_PATH)
+    # Only a library the processor deduplicates has an index to keep in step
+    dedup = DedupIndex(PROCESSING_PATH) if os.path.exists(DEDUP_DB) else None
 
-    for file_path in files:
-        if processed % 1000 == 0:
-            logger.info(f"Progress: {processed}/{total_files} ({(processed/total_files)*100:.1f}%)")
-        
-        meta = metadata_map.get(file_path, {})
-        date_str = None
-        method = None
-
-        # ExifTool formats dates like "2024:05:01 12:34:56"
-        for tag in ['DateTimeOriginal', 'CreateDate']:
-            val = meta.get(tag)
-            if val and len(val) >= 10:
-                # Replace colons in the date part (first 10 chars) with underscores
-                d_part = val[:10].replace(':', '_')
-                if len(d_part) == 10 and d_part.count('_') == 2:
-                    date_str = d_part
-                    method = f"exif_{tag.lower()}"
-                    break
-        
-        if not date_str:
-            # Fallback to filesystem mtime
-            try:
-                mtime = os.path.getmtime(file_path)
-                dt = datetime.fromtimestamp(mtime)
-                date_str = dt.strftime("%Y_%m_%d")
-                method = "fallback_mtime"
-            except Exception as e:
-                logger.error(f"Could not get mtime for {file_path}: {e}")
-                date_str = "1970_01_01"
-                method = "fallback_mtime"
-
-        if method:
-            method_counts[method] += 1
-
-        dest_dir = os.path.join(PROCESSING_PATH, date_str)
-        os.makedirs(dest_dir, exist_ok=True)
-
-        media_basename = os.path.basename(file_path)
-        dest_media = _unique_dest(os.path.join(dest_dir, media_basename))
-        shutil.move(file_path, dest_media)
-        processed += 1
+    try:
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            for start in range(0, total_files, CHUNK_SIZE):
+                chunk = files[start:start + CHUNK_SIZE]
+                logger.info(f"Progress: {processed}/{total_files} ({(processed/total_files)*100:.1f}%)")
+
+                for file_path, date_str, method in _resolve_chunk(chunk, pool, exiftool, source_counts):
+                    method_counts[method] += 1
+
+                    dest_dir = os.path.join(PROCESSING_PATH, date_str)
+                    os.makedirs(dest_dir, exist_ok=True)
+
+                    media_basename = os.path.basename(file_path)
+                    dest_media = _unique_dest(os.path.join(dest_dir, media_basename))
+                    try:
+                        shutil.move(file_path, dest_media)
+                    except Exception as e:
+                        logger.error(f"Could not move {file_path}: {e}")
+                        continue
+                    rel_from = os.path.relpath(file_path, PROCESSING_PATH)
+                    rel_dest = os.path.relpath(dest_media, PROCESSING_PATH)
+                    changes.append("moved", rel_dest, os.path.getsize(dest_media), **{"from": rel_from})
+                    if dedup is not None:
+                        dedup.rename(rel_from, rel_dest)
+                    processed += 1
+    finally:
+        exiftool.close()
+        changes.close()
+        if dedup is not None:
+            dedup.close()
 
     logger.info(f"Finished processing {processed} files.")
     logger.info(f"Categorization methods: {method_counts}")
-    
+    logger.info(f"Date sources: {source_counts}")
+
     # Remove directory if empty
     try:
         os.rmdir(UNKNOWN_DIR)
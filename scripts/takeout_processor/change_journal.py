@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Append-only change journal for PROCESSING_PATH.
+
+The takeout processor and categorize_unknowns.py append one JSON line per
+media file they place, skip as a duplicate or move, so anything downstream
+(the run summary, thumbnail warmers, the web app's date listing) can pick up
+what changed since it last looked instead of rescanning the library.
+
+Records live in numbered segments under <root>/.changes/ and look like
+
+  {"t": 1700000000, "kind": "placed", "dir": "2019_07_13", "name": "IMG_0001.JPG",
+   "size": 123456, "sha256": "…"}
+
+kind is one of KINDS; "skipped" records carry "existing" (the library file
+that already holds the content) and "moved" records carry "from". Delivery
+is at-least-once: a crash between placing a file and journalling it, or a
+resumed archive, can repeat a record, so consumers should be idempotent.
+
+A segment is rotated once it reaches ROTATE_BYTES. Readers are named
+Consumers whose committed offset (segment, byte offset) is stored under
+.changes/consumers/; old segments are pruned only once every consumer has
+read past them, keeping at least KEEP_SEGMENTS.
+"""
+
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROTATE_BYTES = 64 * 1024 * 1024
+KEEP_SEGMENTS = 4
+KINDS = ("placed", "hardlink", "skipped", "moved")
+
+_SEGMENT_RE = re.compile(r"^changes-(\d{8})\.jsonl$")
+
+
+def journal_dir_for(library_root: str) -> str:
+    return os.path.join(library_root, ".changes")
+
+
+def _segment_path(journal_dir: str, seg: int) -> str:
+    return os.path.join(journal_dir, f"changes-{seg:08d}.jsonl")
+
+
+def _segments(journal_dir: str) -> list:
+    """Segment numbers present on disk, oldest first."""
+    try:
+        names = os.listdir(journal_dir)
+    except FileNotFoundError:
+        return []
+    return sorted(int(m.group(1)) for m in map(_SEGMENT_RE.match, names) if m)
+
+
+class ChangeJournal:
+    """
+    Writer. Thread-safe within a process; an flock on .changes/lock keeps
+    concurrent writers (processor + categorize_unknowns) from interleaving a
+    rotation with each other's appends.
+    """
+
+    def __init__(self, library_root: str, journal_dir: str | None = None,
+                 rotate_bytes: int = ROTATE_BYTES):
+        self.dir = journal_dir or journal_dir_for(library_root)
+        self.rotate_bytes = rotate_bytes
+        os.makedirs(os.path.join(self.dir, "consumers"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_fd = os.open(os.path.join(self.dir, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        self._seg = None
+        self._fh = None
+
+    def append(self, kind: str, rel_path: str, size: int | None = None,
+               sha256: str | None = None, **extra) -> None:
+        """Record one change to the library file at rel_path (relative to the root)."""
+        record = {"t": int(time.time()), "kind": kind,
+                  "dir": os.path.dirname(rel_path), "name": os.path.basename(rel_path)}
+        if size is not None:
+            record["size"] = size
+        if sha256:
+            record["sha256"] = sha256
+        record.update(extra)
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+        with self._lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                self._current()
+                if self._fh.tell() >= self.rotate_bytes:
+                    self._rotate()
+                self._fh.write(line)
+                self._fh.flush()
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _current(self) -> None:
+        """Make _fh the newest segment, following a rotation done by another process."""
+        if self._fh is not None and not os.path.exists(_segment_path(self.dir, self._seg + 1)):
+            return
+        segs = _segments(self.dir)
+        self._open(segs[-1] if segs else 1)
+
+    def _open(self, seg: int) -> None:
+        if self._fh is not None:
+            self._fh.close()
+        self._seg = seg
+        self._fh = open(_segment_path(self.dir, seg), "a", encoding="utf-8")
+
+    def _rotate(self) -> None:
+        os.fsync(self._fh.fileno())
+        self._open(self._seg + 1)
+        self._prune()
+
+    def _prune(self) -> None:
+        segs = _segments(self.dir)
+        floor = min((c["segment"] for c in _consumer_offsets(self.dir)), default=None)
+        for seg in segs[:-KEEP_SEGMENTS]:
+            if floor is not None and seg >= floor:
+                break
+            try:
+                os.remove(_segment_path(self.dir, seg))
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                self._fh.close()
+                self._fh = None
+            os.close(self._lock_fd)
+
+
+def _consumer_offsets(journal_dir: str) -> list:
+    out = []
+    cdir = os.path.join(journal_dir, "consumers")
+    for name in os.listdir(cdir) if os.path.isdir(cdir) else ():
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(cdir, name), encoding="utf-8") as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return out
+
+
+def read(journal_dir: str, segment: int = 0, offset: int = 0):
+    """
+    Yield ((segment, offset), record) for every complete record after the
+    given position; the position is the one to resume from after that record.
+    A trailing partial line (a writer mid-append) is left for the next read.
+    """
+    for seg in _segments(journal_dir):
+        if seg < segment:
+            continue
+        start = offset if seg == segment else 0
+        try:
+            f = open(_segment_path(journal_dir, seg), "rb")
+        except FileNotFoundError:
+            continue  # pruned under us
+        with f:
+            f.seek(start)
+            pos = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return
+                pos += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping malformed change record in segment %d at %d.", seg, pos)
+                    continue
+                yield (seg, pos), record
+
+
+class Consumer:
+    """
+    A named reader with a committed offset. Iterate read() and call commit()
+    once the records have been acted on; an uncommitted batch is re-delivered.
+    Consumers may also persist a small JSON state dict with their offset.
+    """
+
+    def __init__(self, library_root: str, name: str, journal_dir: str | None = None):
+        self.dir = journal_dir or journal_dir_for(library_root)
+        self.path = os.path.join(self.dir, "consumers", f"{name}.json")
+        self.name = name
+        self.exists = False
+        self.segment, self.offset, self.state = 0, 0, {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+            self.segment, self.offset = saved["segment"], saved["offset"]
+            self.state = saved.get("state", {})
+            self.exists = True
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning("Consumer %s offset unreadable (%s) – starting over.", name, exc)
+        segs = _segments(self.dir)
+        if self.exists and segs and self.segment < segs[0]:
+            logger.warning("Consumer %s fell behind pruning (segment %d < %d) – some changes were missed.",
+                           name, self.segment, segs[0])
+
+    def read(self):
+        """Yield records after the in-memory position, advancing it as they go."""
+        for (self.segment, self.offset), record in read(self.dir, self.segment, self.offset):
+            yield record
+
+    def seek_to_end(self) -> None:
+        """Skip everything written so far (e.g. after a full rescan)."""
+        for _ in self.read():
+            pass
+
+    def commit(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment": self.segment, "offset": self.offset, "state": self.state}, f)
+        os.replace(tmp, self.path)
+        self.exists = True
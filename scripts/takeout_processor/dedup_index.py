@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Persistent content-hash index over PROCESSING_PATH, used by the takeout
+processor to avoid storing the same photo twice.
+
+One SQLite table keyed on the library-relative path, with size and (lazily)
+SHA-256. Size is the cheap prefilter: a file only gets hashed once another
+file of exactly the same size shows up. Rows whose file has since moved or
+disappeared are dropped the first time a lookup trips over them.
+
+A stored hash is only trusted while the file's mtime_ns matches the one
+recorded when it was hashed (or placed): a file rewritten in place at the
+same size (rotation, metadata edit) is re-hashed before it can stand in for
+an incoming file.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+HASH_BUFSIZE = 1024 * 1024
+SKIP_DIRS = {".manifests", ".thumb_cache", ".dedup", ".progress", ".changes", ".staging", ".audit"}
+
+
+def hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_BUFSIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DedupIndex:
+    """Thread-safe: one connection, guarded by a lock (archive workers share it)."""
+
+    def __init__(self, library_root: str, db_path: str | None = None):
+        self.root = library_root
+        self.db_path = db_path or os.path.join(library_root, ".dedup", "index.sqlite")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        # Claimed by a worker but not on disk yet: a duplicate of one waits for it to settle
+        self._in_flight = set()
+        self._settled = threading.Condition(self._lock)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, sha256 TEXT, mtime_ns INTEGER)"
+        )
+        # Indexes created before mtime_ns was tracked: NULL means "verify before trusting"
+        if "mtime_ns" not in {row[1] for row in self._db.execute("PRAGMA table_info(files)")}:
+            self._db.execute("ALTER TABLE files ADD COLUMN mtime_ns INTEGER")
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_size ON files(size)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_sha ON files(sha256)")
+        self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+    def _abs(self, rel: str) -> str:
+        return os.path.join(self.root, rel)
+
+    def _rehash(self, rel: str) -> None:
+        """(Re-)hash one indexed file, recording the size and mtime_ns it was hashed at."""
+        try:
+            st = os.stat(self._abs(rel))
+            digest = hash_file(self._abs(rel))
+        except OSError:
+            with self._lock:
+                self._db.execute("DELETE FROM files WHERE path = ?", (rel,))
+            return
+        with self._lock:
+            self._db.execute(
+                "UPDATE files SET size = ?, sha256 = ?, mtime_ns = ? WHERE path = ?",
+                (st.st_size, digest, st.st_mtime_ns, rel),
+            )
+
+    def _fill_hashes(self, size: int) -> None:
+        """Hash every indexed file of this size that has no hash yet (outside the lock)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path FROM files WHERE size = ? AND sha256 IS NULL", (size,)
+            ).fetchall()
+        for (rel,) in rows:
+            self._rehash(rel)
+
+    def _revalidate(self, size: int, digest: str) -> None:
+        """Re-hash candidates for this content whose mtime no longer matches their hash (outside the lock)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, mtime_ns FROM files WHERE size = ? AND sha256 = ?", (size, digest)
+            ).fetchall()
+            rows = [r for r in rows if r[0] not in self._in_flight]
+        for rel, mtime_ns in rows:
+            try:
+                if os.stat(self._abs(rel)).st_mtime_ns == mtime_ns:
+                    continue
+            except OSError:
+                pass
+            self._rehash(rel)
+
+    def claim(self, rel_dest: str, size: int, digest: str) -> str | None:
+        """
+        Atomically check-and-register one incoming file.
+
+        Returns the relative path of an existing identical file that is on
+        disk (caller should not store another copy), or None after recording
+        rel_dest as the holder of this content — the caller must then
+        confirm() or forget() it once the file is (or failed to be) in place.
+        Content another worker is still placing is waited for, never returned.
+        """
+        self._fill_hashes(size)
+        self._revalidate(size, digest)
+        with self._lock:
+            while True:
+                rows = self._db.execute(
+                    "SELECT path, mtime_ns FROM files WHERE size = ? AND sha256 = ?", (size, digest)
+                ).fetchall()
+                if not any(rel in self._in_flight for rel, _ in rows):
+                    break
+                self._settled.wait()
+            for rel, mtime_ns in rows:
+                try:
+                    st = os.stat(self._abs(rel))
+                except OSError:
+                    self._db.execute("DELETE FROM files WHERE path = ?", (rel,))
+                    continue
+                if st.st_size == size and st.st_mtime_ns == mtime_ns:
+                    return rel
+                # Changed since it was verified: not a safe duplicate, re-hash on next lookup
+                self._db.execute(
+                    "UPDATE files SET size = ?, sha256 = NULL, mtime_ns = NULL WHERE path = ?",
+                    (st.st_size, rel),
+                )
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (path, size, sha256, mtime_ns) VALUES (?, ?, ?, NULL)",
+                (rel_dest, size, digest),
+            )
+            self._db.commit()
+            self._in_flight.add(rel_dest)
+        return None
+
+    def confirm(self, rel: str) -> None:
+        """The claimed file is in place: pin its hash to the mtime it landed with."""
+        try:
+            mtime_ns = os.stat(self._abs(rel)).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        with self._lock:
+            self._in_flight.discard(rel)
+            self._db.execute("UPDATE files SET mtime_ns = ? WHERE path = ?", (mtime_ns, rel))
+            self._db.commit()
+            self._settled.notify_all()
+
+    def rename(self, old_rel: str, new_rel: str) -> None:
+        """A file moved inside the library: carry its row (and hash) over to the new path."""
+        try:
+            mtime_ns = os.stat(self._abs(new_rel)).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        with self._lock:
+            self._db.execute("DELETE FROM files WHERE path = ?", (new_rel,))
+            # The hash stays pinned only if the move kept the mtime it was verified at
+            self._db.execute(
+                "UPDATE files SET path = ?, mtime_ns = CASE WHEN mtime_ns = ? THEN mtime_ns END WHERE path = ?",
+                (new_rel, mtime_ns, old_rel),
+            )
+            self._db.commit()
+
+    def forget(self, rel: str) -> None:
+        with self._lock:
+            self._in_flight.discard(rel)
+            self._db.execute("DELETE FROM files WHERE path = ?", (rel,))
+            self._db.commit()
+            self._settled.notify_all()
+
+    def backfill(self, known_hashes: dict | None = None) -> dict:
+        """
+        Index the existing library: stat every file, seed hashes we already
+        know (from ingest manifests), then hash only the sizes that collide.
+        Seeded hashes carry no mtime, so a claim re-verifies them before
+        trusting them. Returns counts, including duplicate groups already on disk.
+        """
+        known_hashes = known_hashes or {}
+        rows = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or entry.name in SKIP_DIRS:
+                continue
+            for f in os.scandir(entry.path):
+                if f.is_file() and not f.name.endswith((".json", ".part")):
+                    rel = os.path.join(entry.name, f.name)
+                    rows.append((rel, f.stat().st_size, known_hashes.get(rel)))
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO files (path, size, sha256) VALUES (?, ?, ?)"
+                " ON CONFLICT(path) DO UPDATE SET size = excluded.size,"
+                " sha256 = COALESCE(excluded.sha256, CASE WHEN files.size = excluded.size THEN files.sha256 END),"
+                " mtime_ns = CASE WHEN excluded.sha256 IS NULL AND files.size = excluded.size"
+                " THEN files.mtime_ns END",
+                rows,
+            )
+            self._db.commit()
+            sizes = [s for (s,) in self._db.execute(
+                "SELECT size FROM files GROUP BY size HAVING COUNT(*) > 1")]
+        logger.info("Dedup backfill: %d files indexed, %d colliding sizes to hash.", len(rows), len(sizes))
+        for i, size in enumerate(sizes, 1):
+            if i % 1000 == 0:
+                logger.info("  Hashing collisions: %d/%d", i, len(sizes))
+            self._fill_hashes(size)
+        with self._lock:
+            self._db.commit()
+            groups, extra = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(n - 1), 0) FROM"
+                " (SELECT COUNT(*) AS n FROM files WHERE sha256 IS NOT NULL"
+                "  GROUP BY sha256 HAVING n > 1)"
+            ).fetchone()
+        return {"files": len(rows), "hashed_sizes": len(sizes),
+                "duplicate_groups": groups, "redundant_copies": extra}
@@ -2,33 +2,109 @@
 """
 Google Takeout photo/video processor — v2.
 
-Extracts Google Takeout zip archives one at a time, organises every media file
-into PROCESSING_PATH/<YYYY_MM_DD>/ folders, then deletes the temporary
-extraction tree.
-
-Date detection uses a 4-level fallback chain:
+Reads Google Takeout archives (.zip, .tgz) and organises every media file
+into PROCESSING_PATH/<YYYY_MM_DD>/ folders.
+
+Two ingest modes (INGEST_MODE):
+  stream   – read the zip central directory, resolve dates from sidecar JSON
+             read in memory, and copy each media member once straight into its
+             date folder. No temporary tree, no second write.
+  extract  – legacy: extractall to a temp tree, move files out, rmtree the rest.
+.tgz / .tar.gz exports are always streamed (members read strictly in order,
+through pigz when installed): sidecars are parsed as they go by, and media
+whose sidecar hasn't arrived yet is parked in PROCESSING_PATH/.staging (same
+filesystem, so placing it later is a rename) until it does, TAR_PENDING_MAX
+parked files are waiting, or the archive ends.
+
+Every sidecar in an archive is read and parsed exactly once, up front, on a
+thread pool (orjson when installed) into an in-memory map of timestamp and geo
+data keyed by exact name and (folder, stem). Date detection is then pure
+dictionary lookups, using a 5-level fallback chain:
   1. Exact JSON sidecar  (file.supplemental-metadata.json)
   2. Stem-match sidecar  (same filename stem, different extension's sidecar)
-  3. Filename date parse  (IMG_20180701_095141.jpg → 2018_07_01)
-  4. Zip folder year      ("Photos from 2022" → 2022_01_01)
+  3. Embedded header date (JPEG/HEIC Exif, MP4/MOV mvhd — header_dates.py)
+  4. Filename date parse  (IMG_20180701_095141.jpg → 2018_07_01)
+  5. Zip folder year      ("Photos from 2022" → 2022_01_01)
+Level 3 only runs for media the sidecars couldn't date. In stream mode it looks
+at the first HEADER_BYTES of the member, read from the same stream that then
+copies it, so it costs no extra I/O (an MP4 with moov at the end falls through).
+
+Several archives can be processed at once (PARALLEL_ARCHIVES). A scheduler in
+main() admits the next archive only when projected free space allows it,
+prefers archives whose "Photos from YYYY" folders don't overlap the running
+ones, and IO_CONCURRENCY bounds how many members are written at the same time.
 
 After each zip is fully processed a per-zip checksum manifest is written to
-PROCESSING_PATH/.manifests/<archive_name>.json so every source→dest mapping
-is auditable.
+PROCESSING_PATH/.manifests/<archive_name>.json: for every media member the
+destination, size, SHA-256 and date method used. In stream mode the zip CRC is
+checked and the hash computed in the same pass that copies the member, so the
+archive is read exactly once (no separate testzip()).
+
+Before a media file is placed its hash is checked against a persistent
+library-wide index (dedup_index.py). An exact duplicate of something already
+in PROCESSING_PATH is skipped or hardlinked (DEDUP_MODE) instead of stored as
+name_1.jpg, and the manifest entry records which. Run with
+--backfill-dedup-index once to index a library ingested before this existed.
+
+Every placed member is also appended to a per-archive progress journal
+(PROCESSING_PATH/.progress/<archive>.jsonl, fsynced in batches). If a run is
+killed mid-archive, the next run replays the journal and skips members whose
+destination is already in place, so restart cost tracks the remaining work.
+Torn .part copies from the killed run are deleted before it resumes. The
+journal is created once the archive passes its checks and is removed once
+the archive's manifest is written.
+
+Every media placement, hardlink and dedup skip is also appended to the
+library-wide change journal (change_journal.py, PROCESSING_PATH/.changes/).
+The final summary is kept up to date from it through the "summary" consumer
+rather than by listing every date folder; delete
+.changes/consumers/summary.json to force a full recount.
+
+Time per stage (validate, extract, index, resolve, io_wait, read, hash, write,
+move, manifest), files/s and MB/s and per-date-method counts are collected by
+ingest_metrics.py, written to METRICS_TEXTFILE for node_exporter's textfile
+collector every METRICS_INTERVAL seconds, and summarised at the end of the run.
+
+With INGEST_THUMBNAILS on (off by default), every image placed is also handed
+to a small process pool (ingest_thumbs.py) that renders the web app's default
+grid renditions into PROCESSING_PATH/.thumb_cache while the file is still in
+the page cache.
 """
 
 import os
 import re
+import argparse
 import json
+import hashlib
 import shutil
 import zipfile
+import zlib
+import tarfile
+import subprocess
+import posixpath
 import glob
 import sys
 import logging
 import logging.handlers
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+
+from change_journal import ChangeJournal, Consumer
+from dedup_index import DedupIndex
+from ingest_metrics import IngestMetrics
+from ingest_thumbs import Thumbnailer
+from header_dates import HEADER_BYTES, SUPPORTED_EXTS as HEADER_DATE_EXTS, date_from_file, date_from_head
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # stdlib json is fine, just slower on 100k+ sidecars
+    _json_loads = json.loads
 
 # ---------------------------------------------------------------------------
 # Paths
@@ -36,25 +112,79 @@ from collections import defaultdict
 TAKEOUT_PATH    = "/other_hdd/google_phots_all_take_out"
 PROCESSING_PATH = "/other_hdd/google_phots_all_take_for_processing"
 MANIFEST_DIR    = os.path.join(PROCESSING_PATH, ".manifests")
+JOURNAL_DIR     = os.path.join(PROCESSING_PATH, ".progress")
+CHANGES_DIR     = os.path.join(PROCESSING_PATH, ".changes")
+THUMB_CACHE_DIR = os.path.join(PROCESSING_PATH, ".thumb_cache")  # /photos/.thumb_cache in the web pod
+STAGING_DIR     = os.path.join(PROCESSING_PATH, ".staging")
+
+ARCHIVE_PATTERNS = ("*.zip", "*.tgz", "*.tar.gz")
 
 DISK_HEADROOM_FACTOR = 1.3
 
+# "stream" (default) or "extract" — see module docstring
+INGEST_MODE  = "stream"
+COPY_BUFSIZE = 1024 * 1024
+
+# Archives processed concurrently (1 = strictly sequential, the old behaviour)
+PARALLEL_ARCHIVES = 3
+# Members being written to disk at the same time, across all archives
+IO_CONCURRENCY    = 2
+
+# Exact duplicates of files already in the library: "skip" (store nothing,
+# manifest points at the existing copy), "hardlink" (link into this date
+# folder too) or "off" (old behaviour: keep every copy as name_N.ext)
+DEDUP_MODE = "skip"
+
+# Progress journal durability: fsync after this many entries or seconds
+JOURNAL_FSYNC_EVERY   = 200
+JOURNAL_FSYNC_SECONDS = 5.0
+
+# Threads used to read + parse every sidecar of an archive up front
+SIDECAR_WORKERS = 8
+
+# .tgz ingest: media parked waiting for a sidecar later in the stream, and raw
+# sidecars kept to copy next to media that hasn't arrived yet (oldest evicted)
+TAR_PENDING_MAX    = 256
+TAR_SIDECAR_BUFFER = 20000
+# Parallel gzip for .tgz ("pigz" if on PATH; None = Python's gzip)
+TGZ_DECOMPRESSOR = "pigz"
+
+# node_exporter textfile collector output (None disables) and refresh period
+METRICS_TEXTFILE = "/var/lib/node_exporter/textfile_collector/takeout_processor.prom"
+METRICS_INTERVAL = 15.0
+
+# Optionally render web thumbnails at ingest (needs Pillow and web/app.py to read
+# the sizes from; off automatically without either). Images arriving while
+# THUMB_MAX_PENDING renders are queued get no thumbnail.
+INGEST_THUMBNAILS = False
+THUMB_WORKERS     = 2
+THUMB_MAX_PENDING = 64
+
 # ---------------------------------------------------------------------------
 # Logging  (rotating file + console)
 # ---------------------------------------------------------------------------
 script_dir = os.path.dirname(os.path.abspath(__file__))
-log_file   = os.path.join(script_dir, "google_takeout_processor.log")
-
-_rotating_handler = logging.handlers.RotatingFileHandler(
-    log_file, maxBytes=10 * 1024 * 1024, backupCount=3, encoding="utf-8"
-)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[_rotating_handler, logging.StreamHandler()],
-)
+# TAKEOUT_PROCESSOR_LOG redirects it (bench_ingest.py keeps its runs in WORK)
+log_file   = os.environ.get("TAKEOUT_PROCESSOR_LOG") or os.path.join(script_dir, "google_takeout_processor.log")
+
 logger = logging.getLogger(__name__)
 
+
+def _setup_logging() -> None:
+    """
+    Attach the handlers; called by the entry point only. Thumbnail workers
+    re-import this module under forkserver, and a RotatingFileHandler of their
+    own would have several processes rotating the one file.
+    """
+    rotating_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=10 * 1024 * 1024, backupCount=3, encoding="utf-8"
+    )
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s",
+        handlers=[rotating_handler, logging.StreamHandler()],
+    )
+
 # ---------------------------------------------------------------------------
 # State file
 # ---------------------------------------------------------------------------
@@ -73,12 +203,113 @@ def _load_state() -> set:
 
 def _save_state(processed: set) -> None:
     try:
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
+        # Write-then-rename so a crash mid-write never loses the resume state
+        tmp_path = STATE_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump({"processed": sorted(processed)}, f, indent=2)
+        os.replace(tmp_path, STATE_FILE)
     except Exception as exc:
         logger.error("Could not save state file (%s: %s).", type(exc).__name__, exc)
 
 
+# ---------------------------------------------------------------------------
+# Per-archive progress journal
+# ---------------------------------------------------------------------------
+
+class _ProgressJournal:
+    """
+    Append-only JSON-lines log of members already placed for one archive.
+
+    Lines are flushed immediately and fsynced in batches; a torn last line
+    from a crash is ignored on load. An entry is written once the media and
+    its sidecar (if this member brought one) are both in place, and names the
+    sidecar so a resumed run doesn't copy it again for another member of the
+    same stem. A member placed but not yet journalled when the process died
+    is simply placed again — the dedup index catches the copy, and
+    _wants_sidecar() still puts its sidecar next to it.
+    """
+
+    def __init__(self, safe_stem: str):
+        self.path = os.path.join(JOURNAL_DIR, f"{safe_stem}.jsonl")
+        self.resumed = os.path.exists(self.path)
+        self.done = self._load()
+        self._f = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def open(self) -> None:
+        """
+        Start appending, once the archive has passed its checks (a skipped or
+        rejected archive leaves no journal behind). Resuming a journal means
+        the last run died mid-archive, so its torn .part copies are cleared first.
+        """
+        if self.resumed:
+            removed = _remove_stale_parts()
+            if removed:
+                logger.info("Removed %d stale .part file(s) left by an interrupted run.", removed)
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    def _load(self) -> dict:
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    done[rec.pop("member")] = rec
+                except (ValueError, KeyError):
+                    continue
+        return done
+
+    def resumable(self, member: str) -> dict | None:
+        """Manifest entry for member if its destination is still in place."""
+        entry = self.done.get(member)
+        if entry is None:
+            return None
+        try:
+            if os.path.getsize(os.path.join(PROCESSING_PATH, entry["dest"])) == entry["size"]:
+                return {k: v for k, v in entry.items() if k != "sidecar_file"}
+        except (OSError, KeyError):
+            pass
+        return None
+
+    def placed_sidecars(self) -> set:
+        """Sidecars already copied next to media that is still in place."""
+        return {entry["sidecar_file"] for member, entry in self.done.items()
+                if "sidecar_file" in entry and self.resumable(member)}
+
+    def record(self, member: str, entry: dict, sidecar: str | None = None) -> None:
+        rec = {"member": member, **entry}
+        if sidecar:
+            rec["sidecar_file"] = sidecar
+        self._f.write(json.dumps(rec) + "\n")
+        self._f.flush()
+        self._unsynced += 1
+        if (self._unsynced >= JOURNAL_FSYNC_EVERY
+                or time.monotonic() - self._last_sync >= JOURNAL_FSYNC_SECONDS):
+            self.sync()
+
+    def sync(self) -> None:
+        if self._unsynced:
+            os.fsync(self._f.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if self._f is not None and not self._f.closed:
+            self.sync()
+            self._f.close()
+
+    def discard(self) -> None:
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
 # ---------------------------------------------------------------------------
 # Media & sidecar extensions
 # ---------------------------------------------------------------------------
@@ -100,8 +331,33 @@ def _safe_folder_name(name: str) -> str:
     return re.sub(r"[()\"'\\]", "", name).strip()
 
 
+def _is_tar(archive: str) -> bool:
+    return archive.endswith((".tgz", ".tar.gz"))
+
+
+def _archive_stem(archive: str) -> str:
+    """takeout-001.zip / .tgz / .tar.gz → safe takeout-001."""
+    name = os.path.basename(archive)
+    for ext in (".zip", ".tgz", ".tar.gz"):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+            break
+    return _safe_folder_name(name)
+
+
+_io_slots       = threading.BoundedSemaphore(IO_CONCURRENCY)
+_dest_lock      = threading.Lock()
+_reserved_dests = set()
+# Held from _wants_sidecar() until the sidecar is placed, so workers placing
+# the same content can't both see the folder without it
+_sidecar_lock   = threading.Lock()
+
+
 def _unique_dest(dest_path: str) -> str:
-    if not os.path.exists(dest_path):
+    def taken(path) -> bool:
+        return os.path.exists(path) or str(path) in _reserved_dests
+
+    if not taken(dest_path):
         return dest_path
     p = Path(dest_path)
     suffix = p.suffix
@@ -110,18 +366,144 @@ def _unique_dest(dest_path: str) -> str:
     counter = 1
     while True:
         candidate = parent / f"{stem}_{counter}{suffix}"
-        if not os.path.exists(candidate):
+        if not taken(candidate):
             return str(candidate)
         counter += 1
 
 
+@contextmanager
+def _claim_dest(dest_path: str):
+    """
+    _unique_dest that is safe across archive workers: the chosen name stays
+    reserved until the caller has put the file in place.
+    """
+    with _dest_lock:
+        claimed = _unique_dest(dest_path)
+        _reserved_dests.add(claimed)
+    try:
+        yield claimed
+    finally:
+        with _dest_lock:
+            _reserved_dests.discard(claimed)
+
+
+def _remove_stale_parts() -> int:
+    """
+    Delete .part files in the date folders that no worker is writing, i.e.
+    whose destination isn't reserved. Holds _dest_lock throughout so no copy
+    can claim a destination between the check and the delete.
+    """
+    removed = 0
+    with _dest_lock:
+        for folder in os.scandir(PROCESSING_PATH):
+            if not folder.is_dir() or folder.name.startswith("."):
+                continue
+            for f in os.scandir(folder.path):
+                if f.name.endswith(".part") and f.path[:-len(".part")] not in _reserved_dests:
+                    try:
+                        os.remove(f.path)
+                        removed += 1
+                    except OSError:
+                        pass
+    return removed
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(COPY_BUFSIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+_dedup_index      = None
+_dedup_index_lock = threading.Lock()
+
+_change_journal      = None
+_change_journal_lock = threading.Lock()
+
+_metrics = IngestMetrics()
+
+# Archive path → bytes of its work already settled on its plan's device
+# (written, or found in place); read by the scheduler's free-space projection
+_archive_progress      = defaultdict(int)
+_archive_progress_lock = threading.Lock()
+
+
+def _note_progress(archive: str, nbytes: int) -> None:
+    with _archive_progress_lock:
+        _archive_progress[archive] += nbytes
+_thumbnailer = None  # set by main() when INGEST_THUMBNAILS is on
+
+
+def _log_change(kind: str, path: str, size: int, digest: str, **extra) -> None:
+    """Append one library change to the shared change journal (opened on first use)."""
+    global _change_journal
+    with _change_journal_lock:
+        if _change_journal is None:
+            _change_journal = ChangeJournal(PROCESSING_PATH, CHANGES_DIR)
+    _change_journal.append(kind, os.path.relpath(path, PROCESSING_PATH), size, digest, **extra)
+
+
+def _get_dedup_index() -> DedupIndex | None:
+    global _dedup_index
+    if DEDUP_MODE == "off":
+        return None
+    with _dedup_index_lock:
+        if _dedup_index is None:
+            _dedup_index = DedupIndex(PROCESSING_PATH)
+        return _dedup_index
+
+
+def _dedup_place(src_path: str, dest_path: str, size: int, digest: str, move) -> tuple[str, str | None]:
+    """
+    Put src_path at dest_path via move() unless the library already holds the
+    same content. Returns (path now holding the content, dedup status) where
+    the status is None, "skipped" or "hardlink".
+    """
+    index = _get_dedup_index()
+    if index is None:
+        move(src_path, dest_path)
+        _log_change("placed", dest_path, size, digest)
+        if _thumbnailer is not None:
+            _thumbnailer.submit(dest_path)
+        return dest_path, None
+
+    rel_dest = os.path.relpath(dest_path, PROCESSING_PATH)
+    existing = index.claim(rel_dest, size, digest)
+    if existing is None:
+        try:
+            move(src_path, dest_path)
+        except BaseException:
+            index.forget(rel_dest)
+            raise
+        index.confirm(rel_dest)
+        _log_change("placed", dest_path, size, digest)
+        if _thumbnailer is not None:
+            _thumbnailer.submit(dest_path)
+        return dest_path, None
+
+    # claim() only returns content that is on disk; drop our copy only once the link stands
+    existing_path = os.path.join(PROCESSING_PATH, existing)
+    if DEDUP_MODE == "hardlink":
+        os.link(existing_path, dest_path)
+        os.remove(src_path)
+        _log_change("hardlink", dest_path, size, digest, existing=existing)
+        if _thumbnailer is not None:
+            _thumbnailer.submit(dest_path)  # cache keys are per path, not per content
+        return dest_path, "hardlink"
+    os.remove(src_path)
+    _log_change("skipped", dest_path, size, digest, existing=existing)
+    return existing_path, "skipped"
+
+
 def _free_bytes(path: str) -> int:
     return shutil.disk_usage(path).free
 
 
-def _check_disk_space(zip_path: str, extract_to: str) -> bool:
-    zip_size  = os.path.getsize(zip_path)
-    needed    = int(zip_size * DISK_HEADROOM_FACTOR)
+def _check_disk_space(zip_path: str, extract_to: str, needed: int | None = None) -> bool:
+    if needed is None:
+        needed = int(os.path.getsize(zip_path) * DISK_HEADROOM_FACTOR)
     available = _free_bytes(extract_to)
     if available < needed:
         logger.error(
@@ -149,27 +531,39 @@ def _validate_zip(zip_path: str) -> bool:
 
 
 # ---------------------------------------------------------------------------
-# Date detection — 4-level fallback
+# Date detection — 5-level fallback
 # ---------------------------------------------------------------------------
 
-def _date_from_json(json_path: str) -> str | None:
-    """Level 1 & 2: read photoTakenTime / creationTime from a JSON sidecar."""
-    try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
-        for key in ("photoTakenTime", "creationTime"):
-            ts_str = metadata.get(key, {}).get("timestamp")
-            if ts_str:
-                ts = int(ts_str)
-                if ts > 0:
-                    return datetime.fromtimestamp(ts).strftime("%Y_%m_%d")
-    except Exception:
-        pass
+DATE_METHODS = ("json_exact", "json_stem", "exif_header", "filename", "folder", "unknown")
+
+
+def _new_method_counts() -> dict:
+    return {k: 0 for k in DATE_METHODS}
+
+
+def _date_from_metadata(metadata: dict) -> str | None:
+    """Level 1 & 2: pick photoTakenTime, then creationTime, from a parsed sidecar."""
+    for key in ("photoTakenTime", "creationTime"):
+        ts_str = metadata.get(key, {}).get("timestamp")
+        if ts_str:
+            ts = int(ts_str)
+            if ts > 0:
+                return datetime.fromtimestamp(ts).strftime("%Y_%m_%d")
+    return None
+
+
+def _geo_from_metadata(metadata: dict) -> list | None:
+    """[lat, lon] from geoData (or geoDataExif); Takeout writes 0.0/0.0 for 'none'."""
+    for key in ("geoData", "geoDataExif"):
+        geo = metadata.get(key) or {}
+        lat, lon = geo.get("latitude"), geo.get("longitude")
+        if lat or lon:
+            return [lat, lon]
     return None
 
 
 def _date_from_filename(filename: str) -> str | None:
-    """Level 3: parse YYYYMMDD from filenames like IMG_20180701_095141.jpg."""
+    """Level 4: parse YYYYMMDD from filenames like IMG_20180701_095141.jpg."""
     m = _FILENAME_DATE_RE.search(filename)
     if m:
         year, month, day = m.group(1), m.group(2), m.group(3)
@@ -180,7 +574,7 @@ def _date_from_filename(filename: str) -> str | None:
 
 
 def _date_from_folder(zip_internal_path: str) -> str | None:
-    """Level 4: extract year from folder name like 'Photos from 2022' → 2022_01_01."""
+    """Level 5: extract year from folder name like 'Photos from 2022' → 2022_01_01."""
     m = _FOLDER_YEAR_RE.search(zip_internal_path)
     if m:
         year = m.group(1)
@@ -190,62 +584,127 @@ def _date_from_folder(zip_internal_path: str) -> str | None:
     return None
 
 
+def _resolve_date(media_path: str, zip_internal: str, sidecars: dict,
+                  stem_index: dict, header_date=None) -> tuple[str, str, str | None]:
+    """
+    Run the fallback chain for one media file.
+
+    media_path is a filesystem path (extract mode) or a zip member name (stream
+    mode); sidecars / stem_index come from _parse_sidecars. header_date, if
+    given, is a no-argument callable returning the embedded capture date (or
+    None) — only called when neither sidecar level matched. Returns
+    (date_folder, method, matched_json). matched_json is the sidecar that
+    travels with the media — an exact sidecar is kept even if it had no usable
+    timestamp.
+    """
+    media_dir  = os.path.dirname(media_path)
+    media_name = os.path.basename(media_path)
+    media_stem = os.path.splitext(media_name)[0]
+    matched_json = None
+
+    # --- Level 1: Exact JSON sidecar ---
+    for candidate in (media_path + ".supplemental-metadata.json", media_path + ".json"):
+        meta = sidecars.get(candidate)
+        if meta is not None:
+            matched_json = candidate
+            if meta["date"]:
+                return meta["date"], "json_exact", matched_json
+
+    # --- Level 2: Stem-match sidecar ---
+    for sj in stem_index.get((media_dir, media_stem), ()):
+        if sidecars[sj]["date"]:
+            return sidecars[sj]["date"], "json_stem", sj
+
+    # --- Level 3: Embedded header date ---
+    if header_date is not None:
+        date_folder = header_date()
+        if date_folder:
+            return date_folder, "exif_header", matched_json
+
+    # --- Level 4: Filename date pattern ---
+    date_folder = _date_from_filename(media_name)
+    if date_folder:
+        return date_folder, "filename", matched_json
+
+    # --- Level 5: Folder name year ---
+    date_folder = _date_from_folder(zip_internal)
+    if date_folder:
+        return date_folder, "folder", matched_json
+
+    # --- Fallback: unknown ---
+    return "unknown_date", "unknown", matched_json
+
+
 # ---------------------------------------------------------------------------
-# Build sidecar index for a folder
+# Sidecar metadata: parse every sidecar once
 # ---------------------------------------------------------------------------
 
-def _build_sidecar_index(search_path: str) -> dict:
+def _sidecar_stem(filename: str) -> str:
+    """IMG_2635.JPG.supplemental-metadata.json → IMG_2635."""
+    cleaned = filename
+    if cleaned.endswith(".supplemental-metadata.json"):
+        cleaned = cleaned[:-len(".supplemental-metadata.json")]
+    elif cleaned.endswith(".json"):
+        cleaned = cleaned[:-len(".json")]
+    return os.path.splitext(cleaned)[0]
+
+
+def _parse_sidecar(raw: bytes) -> dict:
+    try:
+        metadata = _json_loads(raw)
+        return {"date": _date_from_metadata(metadata), "geo": _geo_from_metadata(metadata)}
+    except Exception:
+        return {"date": None, "geo": None}
+
+
+def _parse_sidecars(paths: list, read) -> tuple[dict, dict]:
     """
-    Walk search_path and build a lookup:
-      {(folder, stem): [list of json paths]}
+    Read and parse every sidecar once on a thread pool.
 
-    This allows us to match IMG_2635.MP4 to IMG_2635.JPG.supplemental-metadata.json
-    by sharing the stem 'IMG_2635'.
+    paths are filesystem paths or zip member names; read(path) returns bytes.
+    Returns (sidecars, stem_index):
+      sidecars   {path: {"date": "YYYY_MM_DD" | None, "geo": [lat, lon] | None}}
+      stem_index {(folder, stem): [paths]} — lets IMG_2635.MP4 find
+                 IMG_2635.JPG.supplemental-metadata.json via the shared stem.
     """
-    index = defaultdict(list)
-    for root, _dirs, files in os.walk(search_path):
-        for f in files:
-            if not f.lower().endswith(".json"):
-                continue
-            full_path = os.path.join(root, f)
-            # Extract stem: remove .supplemental-metadata.json or .json suffix
-            cleaned = f
-            if cleaned.endswith(".supplemental-metadata.json"):
-                cleaned = cleaned[:-len(".supplemental-metadata.json")]
-            elif cleaned.endswith(".json"):
-                cleaned = cleaned[:-len(".json")]
-            stem = os.path.splitext(cleaned)[0]
-            index[(root, stem)].append(full_path)
-    return index
+    def load(path: str) -> dict:
+        try:
+            return _parse_sidecar(read(path))
+        except Exception:
+            return {"date": None, "geo": None}
 
+    with ThreadPoolExecutor(max_workers=SIDECAR_WORKERS) as pool:
+        sidecars = dict(zip(paths, pool.map(load, paths)))
 
-# ---------------------------------------------------------------------------
-# Core processing for one archive
-# ---------------------------------------------------------------------------
+    stem_index = defaultdict(list)
+    for path in paths:
+        folder, f = os.path.split(path)
+        stem_index[(folder, _sidecar_stem(f))].append(path)
+    return sidecars, stem_index
 
-def process_single_archive(zip_file: str) -> bool:
-    archive_name = os.path.basename(zip_file)
-    safe_stem    = _safe_folder_name(archive_name.replace(".zip", ""))
-    temp_path    = os.path.join(TAKEOUT_PATH, f"temp_extract_{safe_stem}")
 
-    logger.info("=" * 60)
-    logger.info("Archive: %s", archive_name)
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
 
-    # 1. Validate
-    logger.info("Validating archive integrity…")
-    if not _validate_zip(zip_file):
-        return False
 
-    # 2. Disk space
+# ---------------------------------------------------------------------------
+# Organise: extract mode (legacy)
+# ---------------------------------------------------------------------------
+
+def _organise_extracted(zip_file: str, temp_path: str, journal: _ProgressJournal) -> tuple | None:
+    """extractall → walk → move. Returns (manifest, method counts, processed, expected)."""
     logger.info("Checking disk space…")
     if not _check_disk_space(zip_file, TAKEOUT_PATH):
-        return False
+        return None
 
-    # 3. Extract
     try:
         logger.info("Extracting…")
-        with zipfile.ZipFile(zip_file, "r") as zf:
-            zf.extractall(temp_path)
+        with zipfile.ZipFile(zip_file, "r") as zf, _io_slot(), _metrics.stage("extract"):
+            # extractall, a member at a time so the scheduler sees how much has landed
+            for info in zf.infolist():
+                zf.extract(info, temp_path)
+                _note_progress(zip_file, info.file_size)
             # Count expected media files from the zip listing
             zip_media_count = sum(
                 1 for n in zf.namelist()
@@ -255,25 +714,30 @@ def process_single_archive(zip_file: str) -> bool:
     except Exception as exc:
         logger.error("Extraction failed (%s: %s).", type(exc).__name__, exc)
         shutil.rmtree(temp_path, ignore_errors=True)
-        return False
-
-    # 4. Build sidecar index for the entire extracted tree
-    logger.info("Building JSON sidecar index…")
-    sidecar_index = _build_sidecar_index(temp_path)
-    logger.info("Sidecar index: %d unique (folder, stem) entries.", len(sidecar_index))
+        return None
+    journal.open()
 
-    # 5. Find all media files
+    # One walk finds both media files and sidecars
     media_files = []
+    json_files = []
     for root, _dirs, files in os.walk(temp_path):
         for f in files:
-            if os.path.splitext(f.lower())[1] in MEDIA_EXTS:
+            fl = f.lower()
+            if os.path.splitext(fl)[1] in MEDIA_EXTS:
                 media_files.append(os.path.join(root, f))
+            elif fl.endswith(".json"):
+                json_files.append(os.path.join(root, f))
+
+    logger.info("Parsing %d JSON sidecars…", len(json_files))
+    with _metrics.stage("index"):
+        sidecars, stem_index = _parse_sidecars(json_files, _read_file)
+    logger.info("Sidecar index: %d unique (folder, stem) entries.", len(stem_index))
 
     logger.info("Found %d media files to organise.", len(media_files))
 
-    # 6. Organise
     manifest = {}  # source_zip_path → dest_path
-    date_method_counts = {"json_exact": 0, "json_stem": 0, "filename": 0, "folder": 0, "unknown": 0}
+    date_method_counts = _new_method_counts()
+    placed_sidecars = journal.placed_sidecars()
     processed_count = 0
     total = len(media_files)
 
@@ -282,99 +746,548 @@ def process_single_archive(zip_file: str) -> bool:
             logger.info("  Progress: %d/%d (%.1f%%)", i, total, i / total * 100)
 
         try:
-            media_basename = os.path.basename(media_path)
-            media_dir = os.path.dirname(media_path)
-            media_stem = os.path.splitext(media_basename)[0]
-
             # Compute the original zip-internal path for the manifest
             zip_internal = os.path.relpath(media_path, temp_path)
+            resumed = journal.resumable(zip_internal)
+            if resumed:
+                manifest[zip_internal] = resumed
+                date_method_counts[resumed["method"]] += 1
+                processed_count += 1
+                continue
+
+            header_date = None
+            if os.path.splitext(media_path)[1].lower() in HEADER_DATE_EXTS:
+                header_date = lambda: date_from_file(media_path)[0]
+            with _metrics.stage("resolve"):
+                date_folder, method, matched_json = _resolve_date(
+                    media_path, zip_internal, sidecars, stem_index, header_date,
+                )
+            date_method_counts[method] += 1
+            _metrics.method(method)
+
+            with _metrics.stage("move"):
+                # --- Move media file ---
+                dest_dir = Path(PROCESSING_PATH) / date_folder
+                dest_dir.mkdir(parents=True, exist_ok=True)
+
+                size = os.path.getsize(media_path)
+                with _metrics.stage("hash"):
+                    digest = _hash_file(media_path)
+                with _claim_dest(str(dest_dir / os.path.basename(media_path))) as dest_media:
+                    dest_media, dedup = _dedup_place(media_path, dest_media, size, digest, shutil.move)
+                manifest[zip_internal] = _manifest_entry(dest_media, size, digest, method, dedup,
+                                                         sidecars.get(matched_json))
+
+                # --- Move matched JSON sidecar alongside media (once), then journal both ---
+                sidecar = matched_json and os.path.relpath(matched_json, temp_path)
+                with _sidecar_lock:
+                    if (sidecar and sidecar not in placed_sidecars and os.path.exists(matched_json)
+                            and _wants_sidecar(dedup, dest_media, dest_dir, os.path.basename(matched_json),
+                                               lambda: _read_file(matched_json))):
+                        json_basename = os.path.basename(matched_json)
+                        with _claim_dest(str(dest_dir / json_basename)) as dest_json:
+                            shutil.move(matched_json, dest_json)
+                        placed_sidecars.add(sidecar)
+                    else:
+                        sidecar = None
+                journal.record(zip_internal, manifest[zip_internal], sidecar)
+
+            _metrics.placed(size)
+            processed_count += 1
+
+        except Exception as exc:
+            logger.error("Error processing %s (%s: %s) – skipping.", media_path, type(exc).__name__, exc)
 
-            # --- Level 1: Exact JSON sidecar ---
-            date_folder = None
-            matched_json = None
-
-            exact_suppl = media_path + ".supplemental-metadata.json"
-            exact_json  = media_path + ".json"
-
-            if os.path.exists(exact_suppl):
-                date_folder = _date_from_json(exact_suppl)
-                matched_json = exact_suppl
-                if date_folder:
-                    date_method_counts["json_exact"] += 1
-
-            if not date_folder and os.path.exists(exact_json):
-                date_folder = _date_from_json(exact_json)
-                matched_json = exact_json
-                if date_folder:
-                    date_method_counts["json_exact"] += 1
-
-            # --- Level 2: Stem-match sidecar ---
-            if not date_folder:
-                stem_jsons = sidecar_index.get((media_dir, media_stem), [])
-                for sj in stem_jsons:
-                    date_folder = _date_from_json(sj)
-                    if date_folder:
-                        matched_json = sj
-                        date_method_counts["json_stem"] += 1
+    logger.info("Cleaning up extracted files…")
+    shutil.rmtree(temp_path, ignore_errors=True)
+    # testzip() already vetted every CRC up front
+    return manifest, date_method_counts, processed_count, zip_media_count, []
+
+
+# ---------------------------------------------------------------------------
+# Organise: stream mode
+# ---------------------------------------------------------------------------
+
+def _manifest_entry(dest_path: str, size: int, digest: str, method: str,
+                    dedup: str | None = None, sidecar: dict | None = None) -> dict:
+    entry = {
+        "dest": os.path.relpath(dest_path, PROCESSING_PATH),
+        "size": size,
+        "sha256": digest,
+        "method": method,
+    }
+    if dedup:
+        entry["dedup"] = dedup
+    if sidecar and sidecar["geo"]:
+        entry["geo"] = sidecar["geo"]
+    return entry
+
+
+def _wants_sidecar(dedup: str | None, dest_media: str, dest_dir: Path, sidecar_name: str, read) -> bool:
+    """
+    Whether a member's sidecar should be copied next to it. A dedup skip
+    normally drops it, except when the kept copy sits in this same date folder
+    without it: that is this member's own placement from a run that died
+    before the sidecar was written. An identical sidecar already in the folder
+    (copied by a run that died before journalling it) isn't copied again.
+    """
+    existing = os.path.join(dest_dir, sidecar_name)
+    if dedup == "skipped":
+        return os.path.dirname(dest_media) == str(dest_dir) and not os.path.exists(existing)
+    try:
+        with open(existing, "rb") as f:
+            return f.read() != read()
+    except FileNotFoundError:
+        return True
+
+
+def _copy_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo, dest_path: str,
+                 dedup: bool = False, src=None, head: bytes = b"") -> tuple[str, str, str | None]:
+    """
+    Inflate one member straight to dest_path. zipfile checks the CRC-32 when
+    the member is read to EOF and raises BadZipFile on mismatch, so a
+    completed copy is also a verified one.
+
+    src/head continue an already-open member stream whose first bytes were
+    consumed for the header date.
+    """
+    with nullcontext(src) if src else zf.open(info) as src:
+        return _copy_stream(src, dest_path, info.file_size, dedup, head)
+
+
+@contextmanager
+def _io_slot():
+    """Hold one of the IO_CONCURRENCY slots, timing the wait for it as io_wait."""
+    with _metrics.stage("io_wait"):
+        _io_slots.acquire()
+    try:
+        yield
+    finally:
+        _io_slots.release()
+
+
+def _copy_stream(src, dest_path: str, size: int, dedup: bool = False,
+                 head: bytes = b"") -> tuple[str, str, str | None]:
+    """
+    Write head + the rest of src to dest_path via .part (so a crash never
+    leaves a torn file), hashing on the way. With dedup=True the finished
+    .part goes through _dedup_place. Returns (final path, SHA-256, dedup status).
+    """
+    part_path = dest_path + ".part"
+    h = hashlib.sha256(head)
+    try:
+        with _io_slot():
+            # Timed per chunk so inflate, hashing and the disk write show up separately
+            read_s = hash_s = 0.0
+            t0 = time.perf_counter()
+            with open(part_path, "wb") as dst:
+                dst.write(head)
+                while True:
+                    t = time.perf_counter()
+                    chunk = src.read(COPY_BUFSIZE)
+                    t_read = time.perf_counter()
+                    read_s += t_read - t
+                    if not chunk:
                         break
+                    h.update(chunk)
+                    hash_s += time.perf_counter() - t_read
+                    dst.write(chunk)
+            total = time.perf_counter() - t0
+            _metrics.add("read", read_s)
+            _metrics.add("hash", hash_s)
+            _metrics.add("write", total - read_s - hash_s)
+        digest = h.hexdigest()
+        if dedup:
+            final_path, status = _dedup_place(part_path, dest_path, size, digest, os.replace)
+            return final_path, digest, status
+        os.replace(part_path, dest_path)
+        return dest_path, digest, None
+    except BaseException:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
 
-            # --- Level 3: Filename date pattern ---
-            if not date_folder:
-                date_folder = _date_from_filename(media_basename)
-                if date_folder:
-                    date_method_counts["filename"] += 1
 
-            # --- Level 4: Folder name year ---
-            if not date_folder:
-                date_folder = _date_from_folder(zip_internal)
-                if date_folder:
-                    date_method_counts["folder"] += 1
+def _organise_streaming(zip_file: str, journal: _ProgressJournal) -> tuple | None:
+    """Copy media members out of the zip once. Returns (manifest, method counts, processed, expected)."""
+    archive_name = os.path.basename(zip_file)
+    try:
+        zf = zipfile.ZipFile(zip_file, "r")
+    except Exception as exc:
+        logger.error("Could not open %s (%s: %s).", archive_name, type(exc).__name__, exc)
+        return None
+
+    with zf:
+        infos = [i for i in zf.infolist() if not i.is_dir()]
+        # Central-directory offset order = on-disk order → sequential reads on the HDD
+        media_infos = sorted(
+            (i for i in infos if os.path.splitext(i.filename.lower())[1] in MEDIA_EXTS),
+            key=lambda i: i.header_offset,
+        )
+        zip_media_count = len(media_infos)
+
+        logger.info("Checking disk space…")
+        needed = sum(i.file_size for i in infos)
+        if not _check_disk_space(zip_file, PROCESSING_PATH, needed):
+            return None
+        journal.open()
 
-            # --- Fallback: unknown ---
-            if not date_folder:
-                date_folder = "unknown_date"
-                date_method_counts["unknown"] += 1
+        json_infos = sorted(
+            (i for i in infos if i.filename.lower().endswith(".json")),
+            key=lambda i: i.header_offset,
+        )
+        logger.info("Parsing %d JSON sidecars…", len(json_infos))
+        # ZipFile serialises seek+read internally, so pool threads can share it
+        with _metrics.stage("index"):
+            sidecars, stem_index = _parse_sidecars([i.filename for i in json_infos], zf.read)
+        logger.info("Sidecar index: %d unique (folder, stem) entries.", len(stem_index))
+        logger.info("Found %d media files to organise.", zip_media_count)
+
+        manifest = {}  # source_zip_path → dest_path
+        date_method_counts = _new_method_counts()
+        placed_sidecars = journal.placed_sidecars()
+        corrupt = []
+        processed_count = 0
+        total = zip_media_count
+
+        for i, info in enumerate(media_infos, 1):
+            if i % 500 == 0 or i == total:
+                logger.info("  Progress: %d/%d (%.1f%%)", i, total, i / total * 100)
+
+            try:
+                zip_internal = info.filename
+                resumed = journal.resumable(zip_internal)
+                if resumed:
+                    manifest[zip_internal] = resumed
+                    date_method_counts[resumed["method"]] += 1
+                    processed_count += 1
+                    _note_progress(zip_file, info.file_size)
+                    continue
+
+                # One open stream per member: the header date (if needed)
+                # peeks at its first bytes, the copy carries on from there
+                with zf.open(info) as src:
+                    head = []
+                    header_date = None
+                    ext = posixpath.splitext(zip_internal)[1].lower()
+                    if ext in HEADER_DATE_EXTS:
+                        def header_date():
+                            head.append(src.read(HEADER_BYTES))
+                            return date_from_head(head[0], ext)[0]
+                    with _metrics.stage("resolve"):
+                        date_folder, method, matched_json = _resolve_date(
+                            zip_internal, zip_internal, sidecars, stem_index, header_date,
+                        )
+                    date_method_counts[method] += 1
+                    _metrics.method(method)
+
+                    # --- Copy media member ---
+                    with _metrics.stage("move"):
+                        dest_dir = Path(PROCESSING_PATH) / date_folder
+                        dest_dir.mkdir(parents=True, exist_ok=True)
+
+                        with _claim_dest(str(dest_dir / posixpath.basename(zip_internal))) as dest_media:
+                            dest_media, digest, dedup = _copy_member(zf, info, dest_media, dedup=True,
+                                                                     src=src, head=b"".join(head))
+                manifest[zip_internal] = _manifest_entry(dest_media, info.file_size, digest, method, dedup,
+                                                         sidecars.get(matched_json))
+
+                # --- Copy matched JSON sidecar alongside media (once), then journal both ---
+                sidecar = None
+                with _sidecar_lock:
+                    if (matched_json and matched_json not in placed_sidecars
+                            and _wants_sidecar(dedup, dest_media, dest_dir, posixpath.basename(matched_json),
+                                               lambda: zf.read(matched_json))):
+                        with _metrics.stage("move"), \
+                                _claim_dest(str(dest_dir / posixpath.basename(matched_json))) as dest_json:
+                            _copy_member(zf, zf.getinfo(matched_json), dest_json)
+                        placed_sidecars.add(matched_json)
+                        sidecar = matched_json
+                journal.record(zip_internal, manifest[zip_internal], sidecar)
+
+                _metrics.placed(info.file_size)
+                _note_progress(zip_file, info.file_size)
+                processed_count += 1
+
+            except zipfile.BadZipFile as exc:
+                logger.error("Corrupt entry %s (%s) – skipping.", info.filename, exc)
+                corrupt.append(info.filename)
+            except Exception as exc:
+                logger.error("Error processing %s (%s: %s) – skipping.", info.filename, type(exc).__name__, exc)
+
+    return manifest, date_method_counts, processed_count, zip_media_count, corrupt
 
-            # --- Move media file ---
+
+# ---------------------------------------------------------------------------
+# Organise: .tgz stream
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def _open_tar(archive: str):
+    """Sequential tar reader, decompressed by TGZ_DECOMPRESSOR when it's installed."""
+    tool = TGZ_DECOMPRESSOR and shutil.which(TGZ_DECOMPRESSOR)
+    if not tool:
+        with tarfile.open(archive, "r|gz") as tf:
+            yield tf
+        return
+    proc = subprocess.Popen([tool, "-dc", archive], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode="r|") as tf:
+            yield tf
+        proc.stdout.close()
+        if proc.wait() != 0:
+            raise tarfile.ReadError(f"{TGZ_DECOMPRESSOR}: {proc.stderr.read().decode(errors='replace').strip()}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+# Reading past these leaves the tar stream unusable (OSError covers gzip CRC
+# failures and a full disk alike — both end the archive)
+_STREAM_ERRORS = (tarfile.TarError, EOFError, OSError, zlib.error)
+
+
+def _sidecar_media_name(sidecar: str) -> str:
+    """IMG_1.JPG.supplemental-metadata.json → IMG_1.JPG (the exact-match media name)."""
+    for suffix in (".supplemental-metadata.json", ".json"):
+        if sidecar.endswith(suffix):
+            return sidecar[:-len(suffix)]
+    return sidecar
+
+
+def _media_key(member: str) -> tuple:
+    """(folder, stem) of a media member — the stem_index key its sidecars live under."""
+    return posixpath.dirname(member), posixpath.splitext(posixpath.basename(member))[0]
+
+
+def _write_bytes(dest_path: str, data: bytes) -> None:
+    part_path = dest_path + ".part"
+    with open(part_path, "wb") as f:
+        f.write(data)
+    os.replace(part_path, dest_path)
+
+
+def _organise_tar(archive: str, safe_stem: str, journal: _ProgressJournal) -> tuple | None:
+    """
+    One sequential pass over a .tgz. Returns (manifest, method counts,
+    processed, expected, corrupt) like the zip paths; expected is the number of
+    media members seen, since a tar has no directory to count up front.
+
+    A media member whose sidecar is already known is copied straight to its
+    date folder. Otherwise it is streamed (and hashed) into a per-archive
+    staging dir and parked; when its sidecar turns up, when TAR_PENDING_MAX is
+    exceeded (oldest first) or at the end, the date is resolved with whatever
+    is known by then and the staged file is renamed into place.
+    """
+    archive_name = os.path.basename(archive)
+    logger.info("Checking disk space…")
+    if not _check_disk_space(archive, PROCESSING_PATH):
+        return None
+    journal.open()
+
+    staging = os.path.join(STAGING_DIR, safe_stem)
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    manifest = {}
+    date_method_counts = _new_method_counts()
+    sidecars, stem_index = {}, defaultdict(list)
+    raw_sidecars = OrderedDict()   # sidecar name → bytes, until copied next to its media
+    pending = OrderedDict()        # media name → {"stage", "size", "digest"}
+    placed_sidecars = journal.placed_sidecars()
+    corrupt = []
+    processed_count = 0
+    media_seen = 0
+
+    def place(member: str, src_path: str | None = None, src=None, size: int = 0, digest: str | None = None):
+        """Resolve and place one media member, from the open tar stream or a staged file."""
+        nonlocal processed_count
+        header_date = None
+        if os.path.splitext(member)[1].lower() in HEADER_DATE_EXTS and src_path:
+            header_date = lambda: date_from_file(src_path)[0]
+        with _metrics.stage("resolve"):
+            date_folder, method, matched_json = _resolve_date(member, member, sidecars, stem_index, header_date)
+        date_method_counts[method] += 1
+        _metrics.method(method)
+
+        with _metrics.stage("move"):
             dest_dir = Path(PROCESSING_PATH) / date_folder
             dest_dir.mkdir(parents=True, exist_ok=True)
+            with _claim_dest(str(dest_dir / posixpath.basename(member))) as dest_media:
+                if src is not None:
+                    dest_media, digest, dedup = _copy_stream(src, dest_media, size, dedup=True)
+                    _note_progress(archive, size)
+                else:
+                    dest_media, dedup = _dedup_place(src_path, dest_media, size, digest, os.replace)
+            manifest[member] = _manifest_entry(dest_media, size, digest, method, dedup, sidecars.get(matched_json))
+
+            sidecar = None
+            with _sidecar_lock:
+                if (matched_json in raw_sidecars and matched_json not in placed_sidecars
+                        and _wants_sidecar(dedup, dest_media, dest_dir, posixpath.basename(matched_json),
+                                           lambda: raw_sidecars[matched_json])):
+                    with _claim_dest(str(dest_dir / posixpath.basename(matched_json))) as dest_json:
+                        _write_bytes(dest_json, raw_sidecars.pop(matched_json))
+                    placed_sidecars.add(matched_json)
+                    sidecar = matched_json
+            journal.record(member, manifest[member], sidecar)
+        _metrics.placed(size)
+        processed_count += 1
+
+    def place_pending(member: str) -> None:
+        entry = pending.pop(member)
+        try:
+            place(member, entry["stage"], size=entry["size"], digest=entry["digest"])
+        except Exception as exc:
+            logger.error("Error processing %s (%s: %s) – skipping.", member, type(exc).__name__, exc)
+        finally:
+            if os.path.exists(entry["stage"]):
+                os.remove(entry["stage"])
 
-            dest_media = _unique_dest(str(dest_dir / media_basename))
-            shutil.move(media_path, dest_media)
-            manifest[zip_internal] = os.path.relpath(dest_media, PROCESSING_PATH)
+    try:
+        with _open_tar(archive) as tf:
+            for ti in tf:
+                if not ti.isfile():
+                    continue
+                name = ti.name
+                lower = name.lower()
+
+                if lower.endswith(".json"):
+                    with _metrics.stage("index"):
+                        raw = tf.extractfile(ti).read()
+                        sidecars[name] = _parse_sidecar(raw)
+                        key = (posixpath.dirname(name), _sidecar_stem(posixpath.basename(name)))
+                        stem_index[key].append(name)
+                    raw_sidecars[name] = raw
+                    if len(raw_sidecars) > TAR_SIDECAR_BUFFER:
+                        raw_sidecars.popitem(last=False)
+                    # Wake media parked for this sidecar (exact name first, then same stem)
+                    media_name = _sidecar_media_name(name)
+                    waiting = [media_name] if media_name in pending else []
+                    waiting += [m for m in pending if m != media_name and _media_key(m) == key]
+                    for member in waiting:
+                        place_pending(member)
+                    continue
+
+                if os.path.splitext(lower)[1] not in MEDIA_EXTS:
+                    continue
+                media_seen += 1
+                if media_seen % 500 == 0:
+                    logger.info("  Progress: %d media members read", media_seen)
+
+                resumed = journal.resumable(name)
+                if resumed:
+                    manifest[name] = resumed
+                    date_method_counts[resumed["method"]] += 1
+                    processed_count += 1
+                    _note_progress(archive, ti.size)
+                    continue
+
+                src = tf.extractfile(ti)
+                has_sidecar = (name + ".supplemental-metadata.json" in sidecars or name + ".json" in sidecars
+                               or _media_key(name) in stem_index)
+                try:
+                    if has_sidecar:
+                        place(name, src=src, size=ti.size)
+                        continue
+                    stage = os.path.join(staging, f"{media_seen}{posixpath.splitext(lower)[1]}")
+                    _, digest, _ = _copy_stream(src, stage, ti.size)
+                    # Staging shares the library's device; placing it later is a rename
+                    _note_progress(archive, ti.size)
+                    pending[name] = {"stage": stage, "size": ti.size, "digest": digest}
+                except _STREAM_ERRORS:
+                    raise
+                except Exception as exc:
+                    logger.error("Error processing %s (%s: %s) – skipping.", name, type(exc).__name__, exc)
+                    continue
+
+                while len(pending) > TAR_PENDING_MAX:
+                    place_pending(next(iter(pending)))
+
+        # End of archive: nothing else is coming for whatever is still parked
+        for member in list(pending):
+            place_pending(member)
+    except _STREAM_ERRORS as exc:
+        # A damaged or truncated stream: keep what was placed (the journal
+        # has it) and fail the archive so the next run resumes it
+        logger.error("Could not read %s past member %d (%s: %s).", archive_name, media_seen, type(exc).__name__, exc)
+        corrupt.append(f"<stream after {media_seen} media members: {exc}>")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return manifest, date_method_counts, processed_count, media_seen, corrupt
 
-            # --- Move matched JSON sidecar alongside media ---
-            if matched_json and os.path.exists(matched_json):
-                json_basename = os.path.basename(matched_json)
-                dest_json = _unique_dest(str(dest_dir / json_basename))
-                shutil.move(matched_json, dest_json)
 
-            processed_count += 1
+# ---------------------------------------------------------------------------
+# Core processing for one archive
+# ---------------------------------------------------------------------------
 
-        except Exception as exc:
-            logger.error("Error processing %s (%s: %s) – skipping.", media_path, type(exc).__name__, exc)
+def process_single_archive(zip_file: str) -> bool:
+    archive_name = os.path.basename(zip_file)
+    safe_stem    = _archive_stem(zip_file)
+    temp_path    = os.path.join(TAKEOUT_PATH, f"temp_extract_{safe_stem}")
 
-    logger.info("Organised %d/%d media files.", processed_count, total)
+    logger.info("=" * 60)
+    logger.info("Archive: %s (%s mode)", archive_name, "tar stream" if _is_tar(zip_file) else INGEST_MODE)
+
+    # 1+2. Validate, disk space, organise. Stream mode verifies CRCs while
+    # copying; extract mode still needs the up-front testzip() pass.
+    journal = _ProgressJournal(safe_stem)
+    if journal.done:
+        logger.info("Resuming: %d member(s) already placed by an earlier run.", len(journal.done))
+    try:
+        if _is_tar(zip_file):
+            result = _organise_tar(zip_file, safe_stem, journal)
+        elif INGEST_MODE == "stream":
+            result = _organise_streaming(zip_file, journal)
+        else:
+            logger.info("Validating archive integrity…")
+            with _metrics.stage("validate"):
+                valid = _validate_zip(zip_file)
+            if not valid:
+                return False
+            result = _organise_extracted(zip_file, temp_path, journal)
+    finally:
+        journal.close()
+    if result is None:
+        return False
+    manifest, date_method_counts, processed_count, zip_media_count, corrupt = result
+
+    logger.info("Organised %d/%d media files.", processed_count, zip_media_count)
+    dedup_counts = defaultdict(int)
+    for entry in manifest.values():
+        if "dedup" in entry:
+            dedup_counts[entry["dedup"]] += 1
+    if dedup_counts:
+        logger.info("Duplicates of existing library files: %s", dict(dedup_counts))
     logger.info("Date method breakdown: %s", dict(date_method_counts))
 
-    # 7. Write manifest
+    # 3. Write manifest
     try:
         os.makedirs(MANIFEST_DIR, exist_ok=True)
         manifest_path = os.path.join(MANIFEST_DIR, f"{safe_stem}.json")
         manifest_data = {
+            "version": 2,
             "archive": archive_name,
             "expected_media": zip_media_count,
             "processed_media": processed_count,
             "date_methods": dict(date_method_counts),
+            "corrupt_members": corrupt,
+            "dedup": dict(dedup_counts),
             "files": manifest,
         }
-        with open(manifest_path, "w", encoding="utf-8") as f:
+        with open(manifest_path, "w", encoding="utf-8") as f, _metrics.stage("manifest"):
             json.dump(manifest_data, f, indent=2)
         logger.info("Manifest written: %s", manifest_path)
+        manifest_ok = True
     except Exception as exc:
         logger.error("Could not write manifest (%s: %s).", type(exc).__name__, exc)
+        manifest_ok = False
 
-    # 8. Verify counts
+    # 4. Verify counts
     if processed_count != zip_media_count:
         logger.warning(
             "⚠️  COUNT MISMATCH for %s: zip had %d media, processed %d (diff=%d)",
@@ -383,18 +1296,152 @@ def process_single_archive(zip_file: str) -> bool:
     else:
         logger.info("✅ Count verified: %d/%d media files processed.", processed_count, zip_media_count)
 
-    # 9. Cleanup
-    logger.info("Cleaning up extracted files…")
-    shutil.rmtree(temp_path, ignore_errors=True)
+    # A CRC failure means the archive itself is damaged — leave it out of the
+    # state file so it is retried (or re-downloaded) rather than forgotten.
+    if corrupt:
+        logger.error("%d corrupt member(s) in %s: %s", len(corrupt), archive_name, corrupt[:10])
+        return False
+
+    # The manifest now carries everything the journal knew
+    if manifest_ok:
+        journal.discard()
 
     logger.info("Archive %s complete.", archive_name)
     return True
 
 
+# ---------------------------------------------------------------------------
+# Scheduler: parallel multi-archive ingest
+# ---------------------------------------------------------------------------
+
+def _archive_plan(zip_file: str) -> dict:
+    """
+    Cheap look at the central directory: where the archive will need space,
+    how much, and which "Photos from YYYY" folders it writes into.
+    A .tgz has no directory to look at: media barely compresses, so its size
+    stands in for what it needs, and its years are unknown.
+    """
+    if _is_tar(zip_file):
+        space_path = PROCESSING_PATH
+        needed = int(os.path.getsize(zip_file) * DISK_HEADROOM_FACTOR)
+        names = []
+    elif INGEST_MODE == "stream":
+        space_path = PROCESSING_PATH
+        with zipfile.ZipFile(zip_file, "r") as zf:
+            infos = [i for i in zf.infolist() if not i.is_dir()]
+        needed = sum(i.file_size for i in infos)
+        names = [i.filename for i in infos]
+    else:
+        space_path = TAKEOUT_PATH
+        needed = int(os.path.getsize(zip_file) * DISK_HEADROOM_FACTOR)
+        with zipfile.ZipFile(zip_file, "r") as zf:
+            names = zf.namelist()
+    years = {m.group(1) for m in map(_FOLDER_YEAR_RE.search, names) if m}
+    return {"archive": zip_file, "space_path": space_path, "device": os.stat(space_path).st_dev,
+            "needed": needed, "years": years}
+
+
+def _projected_free(plan: dict, running_plans) -> int:
+    """
+    Free bytes on plan's device minus what running archives there still need.
+    What they have already written is in the free figure, so each reserves
+    only its remaining bytes.
+    """
+    with _archive_progress_lock:
+        reserved = sum(max(0, p["needed"] - _archive_progress[p["archive"]])
+                       for p in running_plans if p["device"] == plan["device"])
+    return _free_bytes(plan["space_path"]) - reserved
+
+
+def _pick_next(queue: list, plans: dict, running_plans: list) -> str | None:
+    """
+    Choose the next archive to admit: it must fit in projected free space;
+    among those, prefer the least output-folder overlap with running archives
+    (less directory contention, fewer seeks between date folders).
+    """
+    busy_years = set().union(*(p["years"] for p in running_plans)) if running_plans else set()
+    best, best_overlap = None, None
+    for zip_file in queue:
+        plan = plans[zip_file]
+        if _projected_free(plan, running_plans) < plan["needed"]:
+            continue
+        overlap = len(plan["years"] & busy_years)
+        if best is None or overlap < best_overlap:
+            best, best_overlap = zip_file, overlap
+            if overlap == 0:
+                break
+    return best
+
+
+def _run_archive(zip_file: str) -> bool:
+    threading.current_thread().name = _archive_stem(zip_file)
+    return process_single_archive(zip_file)
+
+
+def _process_pending(pending: list, on_done) -> None:
+    """
+    Run pending archives on a pool of PARALLEL_ARCHIVES workers.
+
+    on_done(zip_file, ok) is always called from this (the main) thread, so the
+    state file and summary counters never see concurrent updates.
+    """
+    plans = {}
+    queue = []
+    for zip_file in pending:
+        try:
+            plans[zip_file] = _archive_plan(zip_file)
+            queue.append(zip_file)
+        except Exception as exc:
+            logger.error("Cannot read %s (%s: %s).", os.path.basename(zip_file), type(exc).__name__, exc)
+            on_done(zip_file, False)
+
+    running = {}  # future → zip_file
+    started = 0
+    with ThreadPoolExecutor(max_workers=PARALLEL_ARCHIVES) as pool:
+        while queue or running:
+            while queue and len(running) < PARALLEL_ARCHIVES:
+                nxt = _pick_next(queue, plans, [plans[z] for z in running.values()])
+                if nxt is None:
+                    break
+                queue.remove(nxt)
+                started += 1
+                logger.info("Processing archive %d/%d: %s", started, len(pending), os.path.basename(nxt))
+                running[pool.submit(_run_archive, nxt)] = nxt
+
+            if not running:
+                # Nothing fits even with the disk to itself — same outcome as the
+                # per-archive space check, without waiting forever.
+                for zip_file in queue:
+                    plan = plans[zip_file]
+                    logger.error(
+                        "Not enough disk space for %s. Need ~%d GB, have %d GB free.",
+                        os.path.basename(zip_file), plan["needed"] // (1024**3),
+                        _free_bytes(plan["space_path"]) // (1024**3),
+                    )
+                    on_done(zip_file, False)
+                break
+
+            if queue and len(running) < PARALLEL_ARCHIVES:
+                logger.info("Waiting for disk space before admitting %d more archive(s).", len(queue))
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                zip_file = running.pop(fut)
+                with _archive_progress_lock:
+                    _archive_progress.pop(zip_file, None)
+                try:
+                    ok = fut.result()
+                except Exception as exc:
+                    logger.error("Unhandled error in %s (%s: %s).", os.path.basename(zip_file), type(exc).__name__, exc)
+                    ok = False
+                on_done(zip_file, ok)
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 def main() -> None:
+    global _thumbnailer
     logger.info("=" * 60)
     logger.info("Google Takeout processor v2 started at %s", datetime.now().isoformat())
     logger.info("TAKEOUT_PATH    : %s", TAKEOUT_PATH)
@@ -409,13 +1456,13 @@ def main() -> None:
 
     Path(PROCESSING_PATH).mkdir(parents=True, exist_ok=True)
 
-    zip_files = sorted(glob.glob(os.path.join(TAKEOUT_PATH, "*.zip")))
-    logger.info("Found %d zip archive(s).", len(zip_files))
+    zip_files = sorted(p for pattern in ARCHIVE_PATTERNS for p in glob.glob(os.path.join(TAKEOUT_PATH, pattern)))
+    logger.info("Found %d archive(s).", len(zip_files))
     for zf in zip_files:
         logger.info("  %-60s  %.2f GB", os.path.basename(zf), os.path.getsize(zf) / (1024**3))
 
     if not zip_files:
-        logger.warning("No zip archives found. Nothing to do.")
+        logger.warning("No archives found. Nothing to do.")
         return
 
     already_done = _load_state()
@@ -423,24 +1470,24 @@ def main() -> None:
 
     if len(zip_files) - len(pending) > 0:
         logger.info("Skipping %d already-processed archive(s).", len(zip_files) - len(pending))
-    logger.info("Archives to process: %d", len(pending))
+    logger.info("Archives to process: %d (up to %d in parallel)", len(pending), PARALLEL_ARCHIVES)
 
     successful = 0
     failed_archives = []
-    grand_total_methods = {"json_exact": 0, "json_stem": 0, "filename": 0, "folder": 0, "unknown": 0}
+    grand_total_methods = _new_method_counts()
 
-    for i, zip_file in enumerate(pending, 1):
+    def on_done(zip_file: str, ok: bool) -> None:
+        nonlocal successful
         name = os.path.basename(zip_file)
-        logger.info("Processing archive %d/%d: %s", i, len(pending), name)
-
-        if process_single_archive(zip_file):
+        _metrics.archive(ok)
+        if ok:
             successful += 1
             already_done.add(name)
             _save_state(already_done)
 
             # Accumulate method counts from manifest
             try:
-                safe = _safe_folder_name(name.replace(".zip", ""))
+                safe = _archive_stem(name)
                 mf = os.path.join(MANIFEST_DIR, f"{safe}.json")
                 with open(mf) as f:
                     mdata = json.load(f)
@@ -452,27 +1499,97 @@ def main() -> None:
             failed_archives.append(name)
             logger.error("Archive FAILED: %s", name)
 
+    if INGEST_THUMBNAILS:
+        _thumbnailer = Thumbnailer(PROCESSING_PATH, THUMB_CACHE_DIR,
+                                   workers=THUMB_WORKERS, max_pending=THUMB_MAX_PENDING)
+    _metrics.start(METRICS_TEXTFILE, METRICS_INTERVAL)
+    try:
+        _process_pending(pending, on_done)
+    finally:
+        _metrics.stop(METRICS_TEXTFILE)
+        if _thumbnailer is not None:
+            logger.info("Finishing queued thumbnails…")
+            thumb_stats = _thumbnailer.close()
+            _thumbnailer = None
+            logger.info("Ingest thumbnails: %s", thumb_stats)
+
     logger.info("=" * 60)
     logger.info("FINAL SUMMARY")
     logger.info("  Archives processed: %d/%d", successful, len(pending))
     logger.info("  Date method totals: %s", grand_total_methods)
+    for line in _metrics.summary_lines():
+        logger.info("  %s", line)
     if failed_archives:
         logger.error("  Failed archives (%d): %s", len(failed_archives), failed_archives)
 
-    # Count output
-    total_output = 0
-    folder_count = 0
-    for d in os.listdir(PROCESSING_PATH):
-        dp = os.path.join(PROCESSING_PATH, d)
-        if os.path.isdir(dp) and d not in (".manifests", ".thumb_cache"):
-            count = sum(1 for f in os.listdir(dp) if os.path.splitext(f.lower())[1] in MEDIA_EXTS)
-            if count > 0:
-                folder_count += 1
-                total_output += count
-
-    logger.info("  Output: %d media files across %d date folders", total_output, folder_count)
+    if _change_journal is not None:
+        _change_journal.close()
+    folders = _output_counts()
+    logger.info("  Output: %d media files across %d date folders",
+                sum(folders.values()), sum(1 for c in folders.values() if c > 0))
     logger.info("Processor finished at %s", datetime.now().isoformat())
 
 
+def _output_counts() -> dict:
+    """
+    {date folder: media file count}, carried forward from the change journal.
+    Only the first run (or one after the consumer file is deleted) lists
+    every date folder.
+    """
+    consumer = Consumer(PROCESSING_PATH, "summary", CHANGES_DIR)
+    folders = consumer.state.setdefault("folders", {})
+    if not consumer.exists:
+        logger.info("No change-journal summary yet – counting the whole output tree once.")
+        for d in os.listdir(PROCESSING_PATH):
+            dp = os.path.join(PROCESSING_PATH, d)
+            if os.path.isdir(dp) and not d.startswith("."):
+                folders[d] = sum(1 for f in os.listdir(dp) if os.path.splitext(f.lower())[1] in MEDIA_EXTS)
+        consumer.seek_to_end()
+    else:
+        for rec in consumer.read():
+            if os.path.splitext(rec["name"].lower())[1] not in MEDIA_EXTS:
+                continue
+            if rec["kind"] in ("placed", "hardlink"):
+                folders[rec["dir"]] = folders.get(rec["dir"], 0) + 1
+            elif rec["kind"] == "moved":
+                src_dir = os.path.dirname(rec["from"])
+                folders[src_dir] = max(folders.get(src_dir, 0) - 1, 0)
+                folders[rec["dir"]] = folders.get(rec["dir"], 0) + 1
+    consumer.commit()
+    return folders
+
+
+def backfill_dedup_index() -> None:
+    """One-off: index everything already in PROCESSING_PATH for dedup."""
+    logger.info("Backfilling dedup index for %s", PROCESSING_PATH)
+    # Hashes recorded by v2 manifests save re-reading those files
+    known = {}
+    for mf in glob.glob(os.path.join(MANIFEST_DIR, "*.json")):
+        try:
+            with open(mf, encoding="utf-8") as f:
+                files = json.load(f).get("files", {})
+        except Exception as exc:
+            logger.warning("Skipping manifest %s (%s: %s).", mf, type(exc).__name__, exc)
+            continue
+        for entry in files.values():
+            if isinstance(entry, dict) and entry.get("sha256"):
+                known[entry["dest"]] = entry["sha256"]
+
+    index = DedupIndex(PROCESSING_PATH)
+    try:
+        stats = index.backfill(known)
+    finally:
+        index.close()
+    logger.info("Dedup backfill complete: %s", stats)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    _setup_logging()
+    parser = argparse.ArgumentParser(description="Organise Google Takeout archives into date folders.")
+    parser.add_argument("--backfill-dedup-index", action="store_true",
+                        help="index the existing library for duplicate detection, then exit")
+    args = parser.parse_args()
+    if args.backfill_dedup_index:
+        backfill_dedup_index()
+    else:
+        main()
\ No newline at end of file
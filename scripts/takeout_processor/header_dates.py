@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Capture-date reader that looks only at file headers — stdlib only.
+
+  JPEG       APP1 Exif → DateTimeOriginal, then CreateDate (DateTimeDigitized)
+  HEIC/HEIF  meta/iinf/iloc → Exif item → same tags
+  MP4/MOV    moov/mvhd creation time (what exiftool calls QuickTime:CreateDate)
+
+Every reader returns (YYYY_MM_DD, tag) or (None, None) and never raises on
+malformed input. JPEG needs only the first HEADER_BYTES; HEIC and MP4 need to
+seek when the stream allows it (moov is often at the end of a camera MP4).
+"""
+
+import io
+import os
+import struct
+from datetime import datetime, timezone
+
+HEADER_BYTES = 128 * 1024
+
+JPEG_EXTS = {".jpg", ".jpeg"}
+HEIF_EXTS = {".heic", ".heif"}
+QT_EXTS   = {".mp4", ".mov", ".m4v", ".3gp"}
+SUPPORTED_EXTS = JPEG_EXTS | HEIF_EXTS | QT_EXTS
+
+_TAG_DATETIME_ORIGINAL = 0x9003
+_TAG_CREATE_DATE       = 0x9004
+_TAG_EXIF_IFD          = 0x8769
+
+# Seconds between the QuickTime epoch (1904-01-01) and the Unix epoch
+_QT_EPOCH_OFFSET = 2082844800
+_MIN_YEAR, _MAX_YEAR = 1990, 2030
+
+
+def _exif_date(value: str) -> str | None:
+    """'2018:07:01 09:51:41' → '2018_07_01' (rejects 0000:00:00 and junk)."""
+    d_part = value[:10]
+    if len(d_part) != 10 or d_part[4] != ":" or d_part[7] != ":":
+        return None
+    try:
+        y, m, d = int(d_part[:4]), int(d_part[5:7]), int(d_part[8:10])
+        datetime(y, m, d)
+    except ValueError:
+        return None
+    if not _MIN_YEAR <= y <= _MAX_YEAR:
+        return None
+    return f"{y:04d}_{m:02d}_{d:02d}"
+
+
+# ---------------------------------------------------------------------------
+# TIFF / Exif
+# ---------------------------------------------------------------------------
+
+def _tiff_tags(tiff: bytes, offset: int, endian: str) -> dict:
+    """{tag: (type, count, value_or_offset_bytes)} for one IFD."""
+    tags = {}
+    if offset + 2 > len(tiff):
+        return tags
+    (count,) = struct.unpack_from(endian + "H", tiff, offset)
+    for i in range(count):
+        pos = offset + 2 + i * 12
+        if pos + 12 > len(tiff):
+            break
+        tag, typ, n = struct.unpack_from(endian + "HHI", tiff, pos)
+        tags[tag] = (typ, n, tiff[pos + 8:pos + 12])
+    return tags
+
+
+def _tiff_ascii(tiff: bytes, entry: tuple, endian: str) -> str | None:
+    typ, n, raw = entry
+    if typ != 2:
+        return None
+    if n <= 4:
+        data = raw[:n]
+    else:
+        (off,) = struct.unpack(endian + "I", raw)
+        data = tiff[off:off + n]
+    return data.split(b"\0", 1)[0].decode("ascii", "replace")
+
+
+def date_from_tiff(tiff: bytes) -> tuple[str | None, str | None]:
+    """DateTimeOriginal, then CreateDate, from a TIFF-structured Exif block."""
+    try:
+        if tiff[:2] == b"II":
+            endian = "<"
+        elif tiff[:2] == b"MM":
+            endian = ">"
+        else:
+            return None, None
+        (ifd0,) = struct.unpack_from(endian + "I", tiff, 4)
+        exif_ptr = _tiff_tags(tiff, ifd0, endian).get(_TAG_EXIF_IFD)
+        if exif_ptr is None:
+            return None, None
+        (exif_off,) = struct.unpack(endian + "I", exif_ptr[2])
+        exif = _tiff_tags(tiff, exif_off, endian)
+        for tag, name in ((_TAG_DATETIME_ORIGINAL, "DateTimeOriginal"), (_TAG_CREATE_DATE, "CreateDate")):
+            if tag in exif:
+                value = _tiff_ascii(tiff, exif[tag], endian)
+                date = _exif_date(value) if value else None
+                if date:
+                    return date, name
+    except (struct.error, IndexError, ValueError):
+        pass
+    return None, None
+
+
+# ---------------------------------------------------------------------------
+# JPEG
+# ---------------------------------------------------------------------------
+
+def date_from_jpeg(head: bytes) -> tuple[str | None, str | None]:
+    """Walk JPEG markers in the first bytes of the file until the Exif APP1."""
+    if head[:2] != b"\xff\xd8":
+        return None, None
+    pos = 2
+    while pos + 4 <= len(head):
+        if head[pos] != 0xFF:
+            return None, None
+        marker = head[pos + 1]
+        if marker in (0xD9, 0xDA):  # EOI / start of scan — no more metadata
+            return None, None
+        (seg_len,) = struct.unpack_from(">H", head, pos + 2)
+        if marker == 0xE1 and head[pos + 4:pos + 10] == b"Exif\0\0":
+            return date_from_tiff(head[pos + 10:pos + 2 + seg_len])
+        pos += 2 + seg_len
+    return None, None
+
+
+# ---------------------------------------------------------------------------
+# ISO BMFF (HEIC, MP4, MOV)
+# ---------------------------------------------------------------------------
+
+def _boxes(fp, start: int, end: int | None):
+    """Yield (type, payload_offset, payload_size) for boxes in [start, end)."""
+    pos = start
+    while end is None or pos + 8 <= end:
+        fp.seek(pos)
+        hdr = fp.read(8)
+        if len(hdr) < 8:
+            return
+        size, typ = struct.unpack(">I4s", hdr)
+        header = 8
+        if size == 1:
+            ext = fp.read(8)
+            if len(ext) < 8:
+                return
+            (size,) = struct.unpack(">Q", ext)
+            header = 16
+        elif size == 0:
+            if end is None:
+                fp.seek(0, io.SEEK_END)
+                end = fp.tell()
+            size = end - pos
+        if size < header:
+            return
+        yield typ.decode("latin-1"), pos + header, size - header
+        pos += size
+
+
+def _find(fp, start: int, end: int | None, typ: str):
+    for t, off, size in _boxes(fp, start, end):
+        if t == typ:
+            return off, size
+    return None
+
+
+def date_from_quicktime(fp) -> tuple[str | None, str | None]:
+    """moov/mvhd creation_time from a seekable MP4/MOV stream."""
+    try:
+        moov = _find(fp, 0, None, "moov")
+        if moov is None:
+            return None, None
+        mvhd = _find(fp, moov[0], moov[0] + moov[1], "mvhd")
+        if mvhd is None:
+            return None, None
+        fp.seek(mvhd[0])
+        data = fp.read(12)
+        version = data[0]
+        if version == 1:
+            (created,) = struct.unpack_from(">Q", data, 4)
+        else:
+            (created,) = struct.unpack_from(">I", data, 4)
+        if created <= _QT_EPOCH_OFFSET:
+            return None, None
+        dt = datetime.fromtimestamp(created - _QT_EPOCH_OFFSET, tz=timezone.utc)
+        if not _MIN_YEAR <= dt.year <= _MAX_YEAR:
+            return None, None
+        return dt.strftime("%Y_%m_%d"), "CreateDate"
+    except (struct.error, IndexError, ValueError, OverflowError, OSError):
+        return None, None
+
+
+def date_from_heif(fp) -> tuple[str | None, str | None]:
+    """Locate the Exif item through meta/iinf + meta/iloc and read its TIFF block."""
+    try:
+        meta = _find(fp, 0, None, "meta")
+        if meta is None:
+            return None, None
+        meta_start, meta_end = meta[0] + 4, meta[0] + meta[1]  # full box: skip version/flags
+
+        iinf = _find(fp, meta_start, meta_end, "iinf")
+        iloc = _find(fp, meta_start, meta_end, "iloc")
+        if iinf is None or iloc is None:
+            return None, None
+
+        # iinf → item id of the 'Exif' item
+        fp.seek(iinf[0])
+        version = fp.read(4)[0]
+        entries_start = iinf[0] + 4 + (2 if version == 0 else 4)
+        exif_id = None
+        for t, off, size in _boxes(fp, entries_start, iinf[0] + iinf[1]):
+            if t != "infe":
+                continue
+            fp.seek(off)
+            body = fp.read(min(size, 16))
+            infe_version = body[0]
+            if infe_version < 2:
+                continue
+            if infe_version == 2:
+                (item_id,) = struct.unpack_from(">H", body, 4)
+                item_type = body[8:12]
+            else:
+                (item_id,) = struct.unpack_from(">I", body, 4)
+                item_type = body[10:14]
+            if item_type == b"Exif":
+                exif_id = item_id
+                break
+        if exif_id is None:
+            return None, None
+
+        # iloc → file extent of that item
+        fp.seek(iloc[0])
+        body = fp.read(iloc[1])
+        version = body[0]
+        offset_size, length_size = body[4] >> 4, body[4] & 0x0F
+        base_size = body[5] >> 4
+        index_size = body[5] & 0x0F if version in (1, 2) else 0
+        pos = 6
+        if version < 2:
+            (count,) = struct.unpack_from(">H", body, pos)
+            pos += 2
+        else:
+            (count,) = struct.unpack_from(">I", body, pos)
+            pos += 4
+
+        def read_n(n: int) -> int:
+            nonlocal pos
+            val = int.from_bytes(body[pos:pos + n], "big") if n else 0
+            pos += n
+            return val
+
+        for _ in range(count):
+            item_id = read_n(2 if version < 2 else 4)
+            if version in (1, 2):
+                read_n(2)  # construction_method
+            read_n(2)      # data_reference_index
+            base = read_n(base_size)
+            (extents,) = struct.unpack_from(">H", body, pos)
+            pos += 2
+            first = None
+            for _ in range(extents):
+                read_n(index_size)
+                ext_off, ext_len = read_n(offset_size), read_n(length_size)
+                if first is None:
+                    first = (base + ext_off, ext_len)
+            if item_id == exif_id and first is not None:
+                fp.seek(first[0])
+                data = fp.read(min(first[1], HEADER_BYTES))
+                (tiff_off,) = struct.unpack_from(">I", data, 0)
+                return date_from_tiff(data[4 + tiff_off:].removeprefix(b"Exif\0\0"))
+    except (struct.error, IndexError, ValueError, OSError):
+        pass
+    return None, None
+
+
+# ---------------------------------------------------------------------------
+# Entry points
+# ---------------------------------------------------------------------------
+
+def date_from_stream(fp, ext: str) -> tuple[str | None, str | None]:
+    """Dispatch on extension; fp must be seekable for HEIC/MP4."""
+    ext = ext.lower()
+    if ext in JPEG_EXTS:
+        return date_from_jpeg(fp.read(HEADER_BYTES))
+    if ext in HEIF_EXTS:
+        return date_from_heif(fp)
+    if ext in QT_EXTS:
+        return date_from_quicktime(fp)
+    return None, None
+
+
+def date_from_head(head: bytes, ext: str) -> tuple[str | None, str | None]:
+    """Same, from only the first bytes of a file (non-seekable sources)."""
+    return date_from_stream(io.BytesIO(head), ext)
+
+
+def date_from_file(path: str) -> tuple[str | None, str | None]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in SUPPORTED_EXTS:
+        return None, None
+    try:
+        with open(path, "rb") as f:
+            return date_from_stream(f, ext)
+    except OSError:
+        return None, None
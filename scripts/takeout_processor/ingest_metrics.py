@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Throughput instrumentation for the takeout processor.
+
+Archive workers record time per stage, processed files/bytes and date methods
+into one shared IngestMetrics. A background thread writes the totals to a
+Prometheus node_exporter textfile-collector file every interval (atomically,
+as the collector requires), and summary_lines() renders the end-of-run report.
+
+Stage seconds are summed across workers, so with several archives in flight
+they can add up to more than the wall-clock run time. Stages nest: time spent
+in an inner stage (or add()ed while one is open) is charged to it and not to
+the enclosing one, so the per-stage figures never double count. Copying is
+split into io_wait (waiting for an IO_CONCURRENCY slot), read (inflating /
+reading from the archive), hash and write (into the library), with "move"
+left holding only the dedup lookup, renames and bookkeeping.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("validate", "extract", "index", "resolve", "io_wait", "read", "hash", "write", "move", "manifest")
+PREFIX = "takeout"
+
+
+class IngestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self._t0 = time.monotonic()
+        self.stage_seconds = defaultdict(float)
+        self.methods = defaultdict(int)
+        self.archives = defaultdict(int)
+        self.files = 0
+        self.bytes = 0
+        self.running = False
+        # Rate gauges: files/bytes per second since the previous write
+        self._last = (self._t0, 0, 0)
+        self.files_per_second = 0.0
+        self.bytes_per_second = 0.0
+        self._stop = threading.Event()
+        self._writer = None
+        # Per thread: seconds already charged to inner stages of each open stage
+        self._local = threading.local()
+
+    def _open_stages(self) -> list:
+        if not hasattr(self._local, "inner"):
+            self._local.inner = []
+        return self._local.inner
+
+    @contextmanager
+    def stage(self, name: str):
+        inner = self._open_stages()
+        inner.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            own = elapsed - inner.pop()
+            if inner:
+                inner[-1] += elapsed
+            with self._lock:
+                self.stage_seconds[name] += own
+
+    def add(self, name: str, seconds: float) -> None:
+        """Charge seconds measured by the caller (e.g. summed over a copy loop) to a stage."""
+        inner = self._open_stages()
+        if inner:
+            inner[-1] += seconds
+        with self._lock:
+            self.stage_seconds[name] += seconds
+
+    def placed(self, size: int) -> None:
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+
+    def method(self, name: str) -> None:
+        with self._lock:
+            self.methods[name] += 1
+
+    def archive(self, ok: bool) -> None:
+        with self._lock:
+            self.archives["ok" if ok else "failed"] += 1
+
+    # -- textfile output ------------------------------------------------------
+
+    def _update_rates(self) -> None:
+        now = time.monotonic()
+        t, files, nbytes = self._last
+        if now > t:
+            self.files_per_second = (self.files - files) / (now - t)
+            self.bytes_per_second = (self.bytes - nbytes) / (now - t)
+        self._last = (now, self.files, self.bytes)
+
+    def render(self) -> str:
+        with self._lock:
+            self._update_rates()
+            lines = []
+
+            def metric(name, kind, help_text, samples):
+                lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+                lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{PREFIX}_{name}{labels} {value}")
+
+            metric("stage_seconds_total", "counter", "Seconds spent per stage, summed across archive workers.",
+                   [(f'{{stage="{s}"}}', round(self.stage_seconds[s], 3)) for s in STAGES])
+            metric("files_total", "counter", "Media files processed this run (placed or dedup-skipped).", [("", self.files)])
+            metric("bytes_total", "counter", "Media bytes processed this run.", [("", self.bytes)])
+            metric("files_per_second", "gauge", "Files processed per second over the last interval.",
+                   [("", round(self.files_per_second, 2))])
+            metric("bytes_per_second", "gauge", "Bytes processed per second over the last interval.",
+                   [("", round(self.bytes_per_second))])
+            metric("date_method_total", "counter", "Media files dated by each fallback level.",
+                   [(f'{{method="{m}"}}', n) for m, n in sorted(self.methods.items())])
+            metric("archives_total", "counter", "Archives finished this run.",
+                   [(f'{{result="{r}"}}', self.archives[r]) for r in ("ok", "failed")])
+            metric("running", "gauge", "1 while the processor is running.", [("", int(self.running))])
+            metric("run_start_timestamp_seconds", "gauge", "Unix time the run started.",
+                   [("", int(self.started))])
+            metric("last_update_timestamp_seconds", "gauge", "Unix time this file was written.",
+                   [("", int(time.time()))])
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(self.render())
+            os.replace(tmp, path)
+        except OSError as exc:
+            logger.warning("Could not write metrics textfile %s (%s).", path, exc)
+
+    def start(self, path: str | None, interval: float) -> None:
+        """Mark the run as started and, if path is set, write it every interval seconds."""
+        self.started, self._t0 = time.time(), time.monotonic()
+        self._last = (self._t0, 0, 0)
+        self.running = True
+        if not path:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.write_textfile(path)
+
+        self.write_textfile(path)
+        self._writer = threading.Thread(target=loop, name="metrics", daemon=True)
+        self._writer.start()
+
+    def stop(self, path: str | None) -> None:
+        self.running = False
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+        if path:
+            # Final rates cover the whole run, not the last partial interval
+            self._last = (self._t0, 0, 0)
+            self.write_textfile(path)
+
+    # -- end-of-run summary ----------------------------------------------------
+
+    def summary_lines(self) -> list:
+        wall = max(time.time() - self.started, 1e-9)
+        busy = sum(self.stage_seconds.values()) or 1e-9
+        lines = [
+            f"Throughput: {self.files} files, {self.bytes / 1024**2:.1f} MB in {wall:.1f}s "
+            f"({self.files / wall:.1f} files/s, {self.bytes / 1024**2 / wall:.1f} MB/s)",
+        ]
+        for s in STAGES:
+            if self.stage_seconds[s]:
+                lines.append(f"  {s:<9} {self.stage_seconds[s]:9.1f}s  {self.stage_seconds[s] / busy:6.1%}")
+        return lines
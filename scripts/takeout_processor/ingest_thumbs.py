@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Ingest-time thumbnails for the web app's disk cache.
+
+While a freshly placed image is still in the page cache, render the grid
+renditions the web app asks for by default and write them under the same
+cache keys as web/app.py's _thumb_cache_path, so the first view is a cache hit.
+The renditions are read from web/app.py's own constants (THUMB_WIDTHS and the
+GRID_/MOBILE_THUMB_* fallbacks, snapped like _snap_width), so the two can't
+drift apart; if that file can't be found or parsed, thumbnails are disabled.
+
+Rendering mirrors web/app.py's _render_thumb (exif_transpose → RGB →
+LANCZOS → JPEG optimize), decoding each image once for all renditions.
+Work runs on a small, niced process pool; when the backlog is full new images
+are dropped rather than slowing ingest down — the web app renders those on
+first view as before.
+
+Needs Pillow (and pillow-heif for HEIC); without it Thumbnailer.available is
+False and ingest carries on without thumbnails.
+"""
+
+import ast
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import logging
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# web/app.py in this checkout; GPHOTO_WEB_APP points elsewhere when the
+# scripts are deployed apart from the repo
+WEB_APP = os.environ.get("GPHOTO_WEB_APP") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "web", "app.py")
+WEB_CONSTANTS = ("THUMB_WIDTHS", "GRID_THUMB_WIDTH", "GRID_THUMB_QUALITY",
+                 "MOBILE_THUMB_WIDTH", "MOBILE_THUMB_QUALITY")
+# Extensions web/app.py resizes (IMAGE_EXTS there)
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".gif", ".heic", ".heif", ".bmp", ".tiff", ".webp")
+NICE = 10
+
+
+def thumb_cache_path(cache_dir: str, filename: str, width, height, quality) -> str:
+    """Same key as web/app.py's _thumb_cache_path (filename is relative to /photos)."""
+    key = hashlib.md5(f"{filename}:{width}:{height}:{quality}".encode()).hexdigest()
+    return os.path.join(cache_dir, f"{key}.jpg")
+
+
+def web_renditions(path: str = WEB_APP) -> tuple | None:
+    """
+    (width, quality) pairs web/app.py requests grid thumbnails at when no
+    client hints arrive, read from its module-level literals. None if the
+    file or any of WEB_CONSTANTS is missing.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), path)
+    except (OSError, SyntaxError):
+        return None
+    consts = {}
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name) and node.targets[0].id in WEB_CONSTANTS):
+            try:
+                consts[node.targets[0].id] = ast.literal_eval(node.value)
+            except ValueError:
+                return None
+    if set(consts) != set(WEB_CONSTANTS):
+        return None
+
+    def snap(px):
+        # web/app.py's _snap_width
+        return next((w for w in consts["THUMB_WIDTHS"] if px <= w), consts["THUMB_WIDTHS"][-1])
+
+    return ((snap(consts["GRID_THUMB_WIDTH"]), consts["GRID_THUMB_QUALITY"]),
+            (snap(consts["MOBILE_THUMB_WIDTH"]), consts["MOBILE_THUMB_QUALITY"]))
+
+
+def _init_worker() -> None:
+    try:
+        os.nice(NICE)
+    except OSError:
+        pass
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+
+
+def render(src_path: str, filename: str, cache_dir: str, renditions) -> int:
+    """Write every missing rendition of one image. Returns how many were written."""
+    todo = [(w, q, thumb_cache_path(cache_dir, filename, w, None, q)) for w, q in renditions]
+    todo = [t for t in todo if not os.path.exists(t[2])]
+    if not todo:
+        return 0
+    with Image.open(src_path) as img:
+        base = ImageOps.exif_transpose(img)
+        if filename.lower().endswith(".heic") or base.mode not in ("RGB", "L"):
+            base = base.convert("RGB")
+        orig_w, orig_h = base.size
+        for width, quality, cache_path in todo:
+            out = base
+            if width < orig_w:
+                out = base.resize((width, int((width / orig_w) * orig_h)), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            out.save(buffer, format="JPEG", quality=quality, optimize=True)
+            tmp = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp, cache_path)
+    return len(todo)
+
+
+class Thumbnailer:
+    """Bounded, fire-and-forget submission of placed images to the render pool."""
+
+    def __init__(self, library_root: str, cache_dir: str, renditions=None,
+                 workers: int = 2, max_pending: int = 64):
+        self.root = library_root
+        self.cache_dir = cache_dir
+        self.renditions = tuple(renditions or web_renditions() or ())
+        self.available = Image is not None and bool(self.renditions)
+        self.stats = {"queued": 0, "dropped": 0, "written": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        if Image is None:
+            logger.warning("Pillow not installed – ingest-time thumbnails disabled.")
+            return
+        if not self.renditions:
+            logger.warning("Could not read thumbnail sizes from %s (set GPHOTO_WEB_APP) – "
+                           "ingest-time thumbnails disabled.", WEB_APP)
+            return
+        logger.info("Ingest-time thumbnails: %s", ", ".join(f"{w}px q{q}" for w, q in self.renditions))
+        os.makedirs(cache_dir, exist_ok=True)
+        # forkserver: the archive worker threads make plain fork() unsafe
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                         mp_context=multiprocessing.get_context("forkserver"))
+
+    def submit(self, path: str) -> bool:
+        """Queue one placed file if it is an image and the backlog has room."""
+        if self._pool is None or not path.lower().endswith(IMAGE_EXTS):
+            return False
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats["dropped"] += 1
+            return False
+        filename = os.path.relpath(path, self.root).replace(os.sep, "/")
+        future = self._pool.submit(render, path, filename, self.cache_dir, self.renditions)
+        future.add_done_callback(self._done)
+        with self._lock:
+            self.stats["queued"] += 1
+        return True
+
+    def _done(self, future) -> None:
+        self._slots.release()
+        exc = future.exception()
+        with self._lock:
+            if exc is None:
+                self.stats["written"] += future.result()
+            else:
+                self.stats["failed"] += 1
+        if exc is not None:
+            logger.debug("Thumbnail render failed (%s: %s).", type(exc).__name__, exc)
+
+    def close(self) -> dict:
+        """Wait for queued renders to finish and return the counters."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        return dict(self.stats)
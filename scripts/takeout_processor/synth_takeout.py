@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Synthetic Google Takeout generator — stdlib only.
+
+Builds takeout-*.zip archives with the layout and quirks of a real Photos
+export, plus truth.json recording every media member's real capture date and
+which quirk ("kind") it exercises, for bench_ingest.py to score against:
+
+  exact        Photos from YYYY/IMG_n.JPG + .supplemental-metadata.json (or legacy .json)
+  live         IMG_n.HEIC with its sidecar + IMG_n.MP4 without one (stem match)
+  edited       IMG_n-edited.jpg next to the original, no sidecar, Exif date
+  exif_only    DSC_n.JPG with an Exif DateTimeOriginal and no sidecar
+  named        PXL_YYYYMMDD_HHMMSSmmm.jpg, no sidecar, no Exif
+  video        VID_n.mp4 with moov (creation time) at the end, no sidecar
+  duplicate    byte-identical copy of an earlier photo in an album folder
+  truncated    long name whose sidecar name Takeout cut to 51 characters
+  split        sidecar lands in the next archive, as Takeout's size split does
+  bare_year    Screenshot_n.png in a year folder, no metadata at all
+  bare_album   image_n.png in an album folder, no metadata at all
+
+Media payloads are random (incompressible, like real JPEG/HEVC data) with
+just enough valid header structure for header_dates.py; they are not
+decodable images. Sizes are drawn around --photo-kb / --video-kb.
+
+  python3 synth_takeout.py OUT_DIR --archives 3 --files 2000 --seed 1
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import struct
+import zipfile
+from datetime import datetime, timezone
+
+PHOTOS = "Takeout/Google Photos"
+ALBUMS = ("Trip to Lisbon", "Family", "Untitled(3)")
+KIND_WEIGHTS = {
+    "exact": 50, "live": 8, "edited": 6, "exif_only": 7, "named": 8, "video": 4,
+    "duplicate": 5, "truncated": 3, "split": 2, "bare_year": 4, "bare_album": 3,
+}
+# Earlier photos kept in memory as candidates for byte-identical duplicates
+DUPLICATE_POOL = 64
+_QT_EPOCH_OFFSET = 2082844800
+_SIDECAR_NAME_LIMIT = 51
+
+
+# ---------------------------------------------------------------------------
+# Payloads
+# ---------------------------------------------------------------------------
+
+def _exif_app1(taken: datetime) -> bytes:
+    """APP1 segment with IFD0 → Exif IFD → DateTimeOriginal (little endian)."""
+    stamp = taken.strftime("%Y:%m:%d %H:%M:%S").encode() + b"\0"
+    tiff = b"II*\0" + struct.pack("<I", 8)
+    tiff += struct.pack("<H", 1) + struct.pack("<HHII", 0x8769, 4, 1, 26) + struct.pack("<I", 0)
+    tiff += struct.pack("<H", 1) + struct.pack("<HHII", 0x9003, 2, len(stamp), 44) + struct.pack("<I", 0)
+    tiff += stamp
+    body = b"Exif\0\0" + tiff
+    return b"\xff\xe1" + struct.pack(">H", len(body) + 2) + body
+
+
+def _jpeg(rng: random.Random, size: int, taken: datetime | None) -> bytes:
+    head = b"\xff\xd8" + (_exif_app1(taken) if taken else b"")
+    sos = b"\xff\xda" + struct.pack(">H", 8) + b"\x01\x01\x00\x00\x3f\x00"
+    return head + sos + rng.randbytes(max(size - len(head) - len(sos) - 2, 0)) + b"\xff\xd9"
+
+
+def _box(typ: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", len(payload) + 8) + typ + payload
+
+
+def _mp4(rng: random.Random, size: int, taken: datetime) -> bytes:
+    """ftyp + mdat + moov/mvhd — moov last, as most phones and cameras write it."""
+    created = int(taken.timestamp()) + _QT_EPOCH_OFFSET
+    mvhd = _box(b"mvhd", struct.pack(">B3xIII", 0, created, created, 1000) + bytes(84))
+    ftyp = _box(b"ftyp", b"isom\0\0\x02\0isomiso2mp41")
+    moov = _box(b"moov", mvhd)
+    return ftyp + _box(b"mdat", rng.randbytes(max(size - len(ftyp) - len(moov) - 8, 0))) + moov
+
+
+def _heic(rng: random.Random, size: int) -> bytes:
+    ftyp = _box(b"ftyp", b"heic\0\0\0\0mif1heic")
+    return ftyp + _box(b"mdat", rng.randbytes(max(size - len(ftyp) - 8, 0)))
+
+
+def _png(rng: random.Random, size: int) -> bytes:
+    return b"\x89PNG\r\n\x1a\n" + rng.randbytes(max(size - 8, 0))
+
+
+def _sidecar(name: str, taken: datetime, rng: random.Random) -> bytes:
+    ts = str(int(taken.timestamp()))
+    geo = {"latitude": round(rng.uniform(-60, 60), 6), "longitude": round(rng.uniform(-150, 150), 6),
+           "altitude": 0.0, "latitudeSpan": 0.0, "longitudeSpan": 0.0}
+    meta = {
+        "title": name,
+        "description": "",
+        "imageViews": str(rng.randint(0, 50)),
+        "creationTime": {"timestamp": ts, "formatted": taken.strftime("%b %d, %Y, %I:%M:%S %p UTC")},
+        "photoTakenTime": {"timestamp": ts, "formatted": taken.strftime("%b %d, %Y, %I:%M:%S %p UTC")},
+        "geoData": geo,
+        "geoDataExif": geo,
+        "url": "https://photos.google.com/photo/" + rng.randbytes(16).hex(),
+        "googlePhotosOrigin": {"mobileUpload": {"deviceType": "ANDROID_PHONE"}},
+    }
+    return json.dumps(meta, indent=2).encode()
+
+
+def _truncated_sidecar_name(media_name: str) -> str:
+    """Takeout caps the whole sidecar name at 51 characters, cutting the suffix first."""
+    full = media_name + ".supplemental-metadata"
+    return full[:_SIDECAR_NAME_LIMIT - len(".json")] + ".json"
+
+
+# ---------------------------------------------------------------------------
+# Layout
+# ---------------------------------------------------------------------------
+
+
+def _random_taken(rng: random.Random, years: tuple) -> datetime:
+    day = rng.randrange(int(datetime(years[0], 1, 1).timestamp()) // 86400,
+                        int(datetime(years[1], 12, 31).timestamp()) // 86400)
+    # Around midday UTC so local-time and UTC readers agree on the date
+    return datetime.fromtimestamp(day * 86400 + rng.randint(9, 15) * 3600, tz=timezone.utc)
+
+
+def _local_date(taken: datetime) -> str:
+    """What the processor should file it under: sidecars are read in local time."""
+    return datetime.fromtimestamp(taken.timestamp()).strftime("%Y_%m_%d")
+
+
+def generate(out_dir: str, archives: int = 2, files: int = 500, seed: int = 0,
+             photo_kb: int = 2500, video_kb: int = 20000, years: tuple = (2006, 2023)) -> dict:
+    """
+    Write `archives` zips holding ~`files` media members in total. Returns the
+    truth map {"<archive>::<member>": {"date", "kind"}} (also saved as truth.json).
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    kinds, weights = zip(*KIND_WEIGHTS.items())
+    # Members are written as they are generated, so memory stays flat
+    zips = [zipfile.ZipFile(os.path.join(out_dir, f"takeout-{arc:03d}.zip"), "w",
+                            zipfile.ZIP_DEFLATED, compresslevel=1) for arc in range(archives)]
+    truth = {}
+    photos = []  # (bytes, taken) of a few earlier photos, for duplicates
+    numbers = itertools.count(1001)  # unique IMG_n so truth keys never collide
+
+    def size(kb):
+        return max(1024, int(rng.lognormvariate(0, 0.4) * kb * 1024))
+
+    def media(arc, name, data, taken, kind):
+        zips[arc].writestr(name, data)
+        truth[f"takeout-{arc:03d}.zip::{name}"] = {"date": _local_date(taken), "kind": kind}
+
+    n = 0
+    while n < files:
+        kind = rng.choices(kinds, weights)[0]
+        arc = rng.randrange(archives)
+        taken = _random_taken(rng, years)
+        year_dir = f"{PHOTOS}/Photos from {taken.year}"
+        num = next(numbers)
+
+        if kind == "exact":
+            name = f"{year_dir}/IMG_{num}.JPG"
+            data = _jpeg(rng, size(photo_kb), taken if rng.random() < 0.7 else None)
+            suffix = ".supplemental-metadata.json" if rng.random() < 0.8 else ".json"
+            zips[arc].writestr(name + suffix, _sidecar(os.path.basename(name), taken, rng))
+            media(arc, name, data, taken, kind)
+            if len(photos) < DUPLICATE_POOL:
+                photos.append((data, taken))
+            else:
+                photos[rng.randrange(DUPLICATE_POOL)] = (data, taken)
+        elif kind == "live":
+            name = f"{year_dir}/IMG_{num}"
+            zips[arc].writestr(name + ".HEIC.supplemental-metadata.json",
+                               _sidecar(os.path.basename(name) + ".HEIC", taken, rng))
+            media(arc, name + ".HEIC", _heic(rng, size(photo_kb)), taken, kind)
+            media(arc, name + ".MP4", _mp4(rng, size(photo_kb), taken), taken, kind)
+            n += 1
+        elif kind == "edited":
+            name = f"{year_dir}/IMG_{num}"
+            data = _jpeg(rng, size(photo_kb), taken)
+            zips[arc].writestr(name + ".jpg.supplemental-metadata.json",
+                               _sidecar(os.path.basename(name) + ".jpg", taken, rng))
+            media(arc, name + ".jpg", data, taken, "exact")
+            media(arc, name + "-edited.jpg", _jpeg(rng, size(photo_kb), taken), taken, kind)
+            n += 1
+        elif kind == "exif_only":
+            media(arc, f"{year_dir}/DSC_{num}.JPG", _jpeg(rng, size(photo_kb), taken), taken, kind)
+        elif kind == "named":
+            stamp = taken.strftime("%Y%m%d_%H%M%S") + f"{rng.randrange(1000):03d}"
+            media(arc, f"{year_dir}/PXL_{stamp}.jpg", _jpeg(rng, size(photo_kb), None), taken, kind)
+        elif kind == "video":
+            media(arc, f"{year_dir}/VID_{num}.mp4", _mp4(rng, size(video_kb), taken), taken, kind)
+        elif kind == "duplicate" and photos:
+            data, dup_taken = rng.choice(photos)
+            name = f"{PHOTOS}/{rng.choice(ALBUMS)}/IMG_{num}.JPG"
+            zips[arc].writestr(name + ".supplemental-metadata.json",
+                               _sidecar(os.path.basename(name), dup_taken, rng))
+            media(arc, name, data, dup_taken, kind)
+        elif kind == "truncated":
+            name = f"{year_dir}/Holiday_panorama_with_the_whole_family_{num}.jpg"
+            zips[arc].writestr(f"{year_dir}/{_truncated_sidecar_name(os.path.basename(name))}",
+                               _sidecar(os.path.basename(name), taken, rng))
+            media(arc, name, _jpeg(rng, size(photo_kb), None), taken, kind)
+        elif kind == "split":
+            name = f"{year_dir}/IMG_{num}.JPG"
+            zips[(arc + 1) % archives].writestr(name + ".supplemental-metadata.json",
+                                                _sidecar(os.path.basename(name), taken, rng))
+            media(arc, name, _jpeg(rng, size(photo_kb), None), taken, kind)
+        elif kind == "bare_year":
+            media(arc, f"{year_dir}/Screenshot_{num}.png", _png(rng, size(photo_kb // 4)), taken, kind)
+        elif kind == "bare_album":
+            media(arc, f"{PHOTOS}/{rng.choice(ALBUMS)}/image_{num}.png", _png(rng, size(photo_kb // 4)),
+                  taken, kind)
+        else:
+            continue
+        n += 1
+
+    for zf in zips:
+        # Album folders also carry Takeout's per-folder metadata.json
+        for album in ALBUMS:
+            zf.writestr(f"{PHOTOS}/{album}/metadata.json", json.dumps({"title": album}))
+        zf.close()
+
+    with open(os.path.join(out_dir, "truth.json"), "w", encoding="utf-8") as f:
+        json.dump(truth, f, indent=1)
+    return truth
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build synthetic Google Takeout zips with ground truth.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--archives", type=int, default=2)
+    parser.add_argument("--files", type=int, default=500, help="media members across all archives")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--photo-kb", type=int, default=2500, help="typical photo size")
+    parser.add_argument("--video-kb", type=int, default=20000, help="typical video size")
+    args = parser.parse_args()
+    truth = generate(args.out_dir, args.archives, args.files, args.seed, args.photo_kb, args.video_kb)
+    print(f"Wrote {args.archives} archive(s), {len(truth)} media members → {args.out_dir}")
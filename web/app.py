@@ -1,10 +1,16 @@
 # Python standard libraries
 import os
+import math
 import hashlib
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 import logging
-from flask import Flask, request, render_template, Response, send_from_directory, jsonify
-from helpers.middleware import setup_metrics
+import threading
+import time
+import hmac
+from flask import Flask, request, render_template, Response, send_from_directory, send_file, jsonify, abort
+from helpers.middleware import setup_metrics, timed
+from helpers import profiler
+from helpers.prefetch import Prefetcher
 import prometheus_client
 from PIL import Image, ImageOps
 from pillow_heif import register_heif_opener
@@ -13,6 +19,8 @@ import json
 
 picFolder = '/photos'
 CACHE_DIR = '/photos/.thumb_cache'
+# Bearer token for /debug/* — endpoints are disabled when unset
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
 
 # WARNING only — no debug spam in prod
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -33,6 +41,27 @@ CONTENT_TYPE_LATEST = str('text/plain; version=0.0.4; charset=utf-8')
 IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.heic', '.heif', '.bmp', '.tiff', '.webp')
 VIDEO_EXTS = ('.mp4', '.mov', '.avi', '.mkv', '.m4v', '.3gp')
 
+# Rendition widths the thumbnail cache is keyed on — every requested width is
+# snapped up to one of these so the cache stays small and hits stay high.
+THUMB_WIDTHS = (320, 480, 640, 800, 1200, 1600, 2000)
+# Grid column floor in CSS px at the default image scale (main.css: 200px * 2.0)
+GRID_MIN_COL_CSS = 400
+# Grid renditions when no client hints arrive (desktop / mobile User-Agent).
+# scripts/takeout_processor/ingest_thumbs.py reads these and THUMB_WIDTHS from
+# this file to pre-render the same cache keys at ingest — keep them literals.
+GRID_THUMB_WIDTH = 800
+GRID_THUMB_QUALITY = 85
+MOBILE_THUMB_WIDTH = 400
+MOBILE_THUMB_QUALITY = 65
+
+# Client hints we opt into via Accept-CH (Sec-CH-* and the legacy names)
+CLIENT_HINTS = ('Sec-CH-DPR', 'Sec-CH-Width', 'Sec-CH-Viewport-Width',
+                'DPR', 'Width', 'Viewport-Width')
+MOBILE_UA_TOKENS = ('mobile', 'android', 'iphone', 'ipad', 'ipod')
+# Upper bounds for client-supplied hints — anything above is clamped
+MAX_HINT_DPR = 4.0
+MAX_HINT_WIDTH = 8192
+
 
 def _get_media_for_date(target_date):
     """Shared logic: scan folders for the given date across up to 100 prior years."""
@@ -54,7 +83,9 @@ def _get_media_for_date(target_date):
 
         years_found.append(past_date.year)
         try:
-            for file in os.listdir(past_path):
+            with timed('listdir'):
+                entries = os.listdir(past_path)
+            for file in entries:
                 file_path = os.path.join('photos', past_folder, file)
                 fl = file.lower()
                 if fl.endswith(IMAGE_EXTS):
@@ -76,6 +107,208 @@ def _thumb_cache_path(filename, width, height, quality, cb=None):
     return os.path.join(CACHE_DIR, f"{key}.jpg")
 
 
+def _snap_width(px):
+    """Round a pixel width up to the nearest cached rendition width."""
+    for w in THUMB_WIDTHS:
+        if px <= w:
+            return w
+    return THUMB_WIDTHS[-1]
+
+
+def _hint(*names, limit=MAX_HINT_WIDTH):
+    """First positive, finite value among the given request headers, clamped to limit; else None."""
+    for name in names:
+        raw = request.headers.get(name)
+        if not raw:
+            continue
+        try:
+            val = float(raw.strip())
+        except ValueError:
+            continue
+        if math.isfinite(val) and val > 0:
+            return min(val, limit)
+    return None
+
+
+def _is_mobile_ua():
+    ua = request.headers.get('User-Agent', '').lower()
+    return any(d in ua for d in MOBILE_UA_TOKENS)
+
+
+def _thumb_size():
+    """
+    Pick (width, quality, is_mobile) for grid thumbnails.
+
+    Client hints win: Sec-CH-Width is already in device pixels; otherwise the
+    grid column width is derived from Viewport-Width and scaled by DPR.
+    Only when no hints arrive do we fall back to User-Agent sniffing.
+    """
+    is_mobile = _is_mobile_ua()
+    dpr = _hint('Sec-CH-DPR', 'DPR', limit=MAX_HINT_DPR) or 1.0
+    width = _hint('Sec-CH-Width', 'Width')
+    if width is None:
+        viewport = _hint('Sec-CH-Viewport-Width', 'Viewport-Width')
+        if viewport is not None:
+            cols = max(1, int(viewport // GRID_MIN_COL_CSS))
+            width = viewport / cols * dpr
+    if width is None:
+        # Snapped here too, so page URLs, serve_photos and the prefetcher share one cache key
+        if is_mobile:
+            return _snap_width(MOBILE_THUMB_WIDTH), MOBILE_THUMB_QUALITY, is_mobile
+        return _snap_width(GRID_THUMB_WIDTH), GRID_THUMB_QUALITY, is_mobile
+    # Dense screens hide compression artefacts — spend the bytes on pixels
+    quality = 70 if dpr >= 2 else 85
+    return _snap_width(int(width)), quality, is_mobile
+
+
+def _render_thumb(file_path, filename, width, height, quality, cache_path):
+    """Decode, orient, resize and JPEG-encode one image; persist it to the cache."""
+    fl = filename.lower()
+    with Image.open(file_path) as img:
+        # exif_transpose may return a *new* image object
+        with timed('decode'):
+            transposed = ImageOps.exif_transpose(img)
+        try:
+            # Normalise everything to RGB/JPEG for the cache
+            if fl.endswith('.heic') or transposed.mode not in ('RGB', 'L'):
+                with timed('decode'):
+                    converted = transposed.convert('RGB')
+                if transposed is not img:
+                    transposed.close()
+                transposed = converted
+
+            orig_w, orig_h = transposed.size
+
+            # Compute target dimensions
+            if width and height:
+                new_w, new_h = width, height
+            elif width:
+                new_w = width
+                new_h = int((width / orig_w) * orig_h)
+            elif height:
+                new_h = height
+                new_w = int((height / orig_h) * orig_w)
+            else:
+                new_w, new_h = orig_w, orig_h
+
+            if new_w < orig_w or new_h < orig_h:
+                with timed('resize'):
+                    resized = transposed.resize((new_w, new_h), Image.Resampling.LANCZOS)
+                if transposed is not img:
+                    transposed.close()
+                transposed = resized
+
+            # Encode once into memory
+            with timed('encode'):
+                buffer = io.BytesIO()
+                transposed.save(buffer, format='JPEG', quality=quality, optimize=True)
+                img_bytes = buffer.getvalue()
+
+            # Persist to cache (best-effort — ignore write errors)
+            try:
+                with open(cache_path, 'wb') as cf:
+                    cf.write(img_bytes)
+            except Exception as cache_err:
+                logging.warning("Thumb cache write failed for %s: %s", filename, cache_err)
+
+            return img_bytes
+
+        finally:
+            if transposed is not img:
+                transposed.close()
+
+
+# ── Adjacent-date prefetch ───────────────────────────────────────────────────
+# goPrev/goNext step one day at a time, so after answering a date we warm the
+# listing and first screenful of thumbnails for the days either side.
+PREFETCH_THUMBS = 12
+# The listing cache lives in each gunicorn worker, so a prefetched listing only
+# helps when the next request lands on the same worker, and a listing can lag
+# an ingest by up to LISTING_TTL seconds — keep it short.
+LISTING_TTL = 60
+LISTING_CACHE_MAX = 64
+
+_listing_cache = {}
+_listing_lock = threading.Lock()
+_inflight = 0
+_prefetcher = Prefetcher(inflight=lambda: _inflight)
+
+
+def _get_media_for_date_cached(target_date):
+    """_get_media_for_date behind a short per-worker TTL cache; returns fresh copies."""
+    now = time.monotonic()
+    with _listing_lock:
+        hit = _listing_cache.get(target_date)
+    if hit and hit[0] > now:
+        media, years_found = hit[1], hit[2]
+    else:
+        media, years_found = _get_media_for_date(target_date)
+        with _listing_lock:
+            if len(_listing_cache) >= LISTING_CACHE_MAX:
+                _listing_cache.clear()
+            _listing_cache[target_date] = (now + LISTING_TTL, media, years_found)
+    # Callers mutate the entries (JSON date strings) — never hand out the cached ones
+    return ({'images': [dict(m) for m in media['images']],
+             'videos': [dict(m) for m in media['videos']]},
+            list(years_found))
+
+
+def _warm_date(target_date, width, quality, cancelled):
+    """Prefetch job: populate the listing cache and render the first screenful."""
+    media, _ = _get_media_for_date_cached(target_date)
+    # Same order the page renders in: newest year first
+    first = sorted(media['images'], key=lambda m: -m['year'])[:PREFETCH_THUMBS]
+    for item in first:
+        if cancelled():
+            return
+        filename = item['path'][len('photos/'):]
+        cache_path = _thumb_cache_path(filename, width, None, quality)
+        if os.path.exists(cache_path):
+            continue
+        try:
+            _render_thumb(os.path.join(picFolder, filename), filename, width, None, quality, cache_path)
+        except Exception as e:
+            logging.warning("Prefetch render failed for %s: %s", filename, e)
+
+
+def _prefetch_neighbours(target_date, response):
+    """Queue d−1 / d+1 warm-up and advertise them with Link: rel=prefetch."""
+    neighbours = [target_date - timedelta(days=1), target_date + timedelta(days=1)]
+    response.headers['Link'] = ', '.join(
+        f"</get_photos/{d.strftime('%Y-%m-%d')}>; rel=prefetch" for d in neighbours)
+    # A real navigation supersedes whatever was queued for the previous page;
+    # a prefetch only extends the queue one step further out.
+    purpose = request.headers.get('Sec-Purpose') or request.headers.get('Purpose') or ''
+    replace = 'prefetch' not in purpose
+    width, quality, _ = _thumb_size()
+    for d in neighbours:
+        _prefetcher.submit((d, width, quality), _warm_date, d, width, quality, replace=replace)
+        replace = False
+
+
+@app.before_request
+def _count_inflight():
+    global _inflight
+    _inflight += 1
+
+
+@app.teardown_request
+def _uncount_inflight(_exc):
+    global _inflight
+    _inflight -= 1
+
+
+@app.after_request
+def _client_hints_headers(response):
+    """Opt into client hints and mark hint-dependent responses as varying."""
+    if request.endpoint == 'index':
+        response.headers['Accept-CH'] = ', '.join(CLIENT_HINTS)
+        response.headers['Critical-CH'] = 'Sec-CH-DPR, Sec-CH-Viewport-Width'
+    if request.endpoint in ('index', 'serve_photos'):
+        response.vary.update(CLIENT_HINTS + ('User-Agent',))
+    return response
+
+
 @app.route("/")
 @app.route("/date/<selected_date>")
 def index(selected_date=None):
@@ -87,15 +320,15 @@ def index(selected_date=None):
     else:
         target_date = date.today()
 
-    ua = request.headers.get('User-Agent', '').lower()
-    is_mobile = any(d in ua for d in ('mobile', 'android', 'iphone', 'ipad', 'ipod'))
-    img_w = 400 if is_mobile else 800
-    img_q = 65 if is_mobile else 85
+    img_w, img_q, is_mobile = _thumb_size()
 
-    media, years_found = _get_media_for_date(target_date)
-    return render_template("index.html", media=media, date=target_date,
-                           years_found=years_found, selected_date=selected_date,
-                           img_w=img_w, img_q=img_q, is_mobile=is_mobile)
+    with timed('index'):
+        media, years_found = _get_media_for_date_cached(target_date)
+    response = Response(render_template("index.html", media=media, date=target_date,
+                                        years_found=years_found, selected_date=selected_date,
+                                        img_w=img_w, img_q=img_q, is_mobile=is_mobile))
+    _prefetch_neighbours(target_date, response)
+    return response
 
 
 @app.route('/get_photos/<selected_date>')
@@ -106,7 +339,8 @@ def get_photos_for_date(selected_date):
     except ValueError:
         return jsonify({'error': 'Invalid date format'}), 400
 
-    media, years_found = _get_media_for_date(target_date)
+    with timed('index'):
+        media, years_found = _get_media_for_date_cached(target_date)
 
     # Dates must be strings for JSON serialisation
     for img in media['images']:
@@ -114,12 +348,14 @@ def get_photos_for_date(selected_date):
     for vid in media['videos']:
         vid['date'] = vid['date'].strftime('%Y-%m-%d')
 
-    return jsonify({
+    response = jsonify({
         'media': media,
         'years_found': years_found,
         'date': target_date.strftime('%Y-%m-%d'),
         'formatted_date': target_date.strftime('%B %d, %Y')
     })
+    _prefetch_neighbours(target_date, response)
+    return response
 
 
 @app.route('/photos/<path:filename>')
@@ -129,11 +365,17 @@ def serve_photos(filename):
     height  = request.args.get('h', type=int)
     quality = request.args.get('q', 85, type=int)
 
-    # Auto-shrink for mobile
-    ua = request.headers.get('User-Agent', '').lower()
-    is_mobile = any(d in ua for d in ('mobile', 'android', 'iphone', 'ipad', 'ipod'))
-    if is_mobile and not width and not height:
-        width = 800
+    # Auto-shrink when the client tells us its size (or looks like a phone)
+    if not width and not height:
+        viewport = _hint('Sec-CH-Viewport-Width', 'Viewport-Width')
+        if viewport:
+            # Full-size (lightbox) view: fill the viewport at device resolution
+            width = _snap_width(int(viewport * (_hint('Sec-CH-DPR', 'DPR', limit=MAX_HINT_DPR) or 1.0)))
+        elif _is_mobile_ua():
+            width = 800
+    elif width and not height:
+        # Only width-only requests are snapped: an explicit w×h box is used as asked
+        width = _snap_width(width)
 
     # No resize needed — serve raw file
     if not width and not height:
@@ -153,61 +395,16 @@ def serve_photos(filename):
     # ── Thumbnail cache hit ───────────────────────────────────────────────────
     cb = request.args.get('cb')
     cache_path = _thumb_cache_path(filename, width, height, quality, cb)
-    if os.path.exists(cache_path):
+    with timed('cache'):
+        cache_hit = os.path.exists(cache_path)
+    if cache_hit:
         return send_from_directory(CACHE_DIR, os.path.basename(cache_path),
                                    mimetype='image/jpeg')
 
     # ── Generate thumbnail ────────────────────────────────────────────────────
     try:
-        with Image.open(file_path) as img:
-            # exif_transpose may return a *new* image object
-            transposed = ImageOps.exif_transpose(img)
-            try:
-                # Normalise everything to RGB/JPEG for the cache
-                if fl.endswith('.heic') or transposed.mode not in ('RGB', 'L'):
-                    converted = transposed.convert('RGB')
-                    if transposed is not img:
-                        transposed.close()
-                    transposed = converted
-
-                orig_w, orig_h = transposed.size
-
-                # Compute target dimensions
-                if width and height:
-                    new_w, new_h = width, height
-                elif width:
-                    new_w = width
-                    new_h = int((width / orig_w) * orig_h)
-                elif height:
-                    new_h = height
-                    new_w = int((height / orig_h) * orig_w)
-                else:
-                    new_w, new_h = orig_w, orig_h
-
-                if new_w < orig_w or new_h < orig_h:
-                    resized = transposed.resize((new_w, new_h), Image.Resampling.LANCZOS)
-                    if transposed is not img:
-                        transposed.close()
-                    transposed = resized
-
-                # Encode once into memory
-                buffer = io.BytesIO()
-                transposed.save(buffer, format='JPEG', quality=quality, optimize=True)
-                img_bytes = buffer.getvalue()
-
-                # Persist to cache (best-effort — ignore write errors)
-                try:
-                    with open(cache_path, 'wb') as cf:
-                        cf.write(img_bytes)
-                except Exception as cache_err:
-                    logging.warning("Thumb cache write failed for %s: %s", filename, cache_err)
-
-                return Response(img_bytes, mimetype='image/jpeg')
-
-            finally:
-                if transposed is not img:
-                    transposed.close()
-
+        img_bytes = _render_thumb(file_path, filename, width, height, quality, cache_path)
+        return Response(img_bytes, mimetype='image/jpeg')
     except Exception as e:
         logging.error("Error processing photo %s: %s", filename, e)
         try:
@@ -249,6 +446,38 @@ def save_settings():
         return jsonify({'error': str(e)}), 500
 
 
+def _require_profile_token():
+    """404 unless PROFILE_TOKEN is configured and presented as a bearer token."""
+    supplied = request.headers.get('Authorization', '')
+    if not PROFILE_TOKEN or not hmac.compare_digest(supplied, f"Bearer {PROFILE_TOKEN}"):
+        abort(404)
+
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Start sampling this worker for ?seconds=N; fetch the dump from the returned result URL."""
+    _require_profile_token()
+    seconds = request.args.get('seconds', 10, type=int)
+    name = profiler.start(seconds)
+    if name is None:
+        return jsonify({'error': 'Profile already running in this worker'}), 409
+    return jsonify({'status': 'started', 'worker': os.getpid(),
+                    'seconds': max(1, min(seconds, profiler.MAX_SECONDS)),
+                    'result': f'/debug/profile/result/{name}'}), 202
+
+
+@app.route('/debug/profile/result/<name>')
+def debug_profile_result(name):
+    """Collapsed-stack dump of one profile (feed to flamegraph.pl or speedscope); 202 while it samples."""
+    _require_profile_token()
+    status, path = profiler.result(name)
+    if status == 'pending':
+        return jsonify({'status': 'running'}), 202
+    if status == 'missing':
+        return jsonify({'error': 'No such profile'}), 404
+    return send_file(path, mimetype='text/plain', download_name=name)
+
+
 @app.route('/metrics/')
 def metrics():
     return Response(prometheus_client.generate_latest(), mimetype=CONTENT_TYPE_LATEST)
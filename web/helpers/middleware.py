@@ -1,5 +1,6 @@
-from flask import request
+from flask import request, g, has_app_context
 from prometheus_client import Counter, Histogram
+from contextlib import contextmanager
 import time
 import sys
 
@@ -14,6 +15,7 @@ REQUEST_LATENCY = Histogram('request_latency_seconds', 'Request latency',
 
 def start_timer():
     request.start_time = time.time()
+    g.server_timing = {}
 
 
 def stop_timer(response):
@@ -28,9 +30,33 @@ def record_request_data(response):
     return response
 
 
+@contextmanager
+def timed(phase):
+    """Accumulate wall time spent in `phase` for this request's Server-Timing header."""
+    if not has_app_context():
+        # Background work (prefetch) has no request to report to
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = g.setdefault('server_timing', {})
+        phases[phase] = phases.get(phase, 0.0) + (time.perf_counter() - start)
+
+
+def add_server_timing(response):
+    phases = g.get('server_timing', {})
+    entries = [f"{name};dur={secs * 1000:.1f}" for name, secs in phases.items()]
+    entries.append(f"total;dur={(time.time() - request.start_time) * 1000:.1f}")
+    response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+
 def setup_metrics(app):
     app.before_request(start_timer)
     # The order here matters since we want stop_timer
     # to be executed first
     app.after_request(record_request_data)
+    app.after_request(add_server_timing)
     app.after_request(stop_timer)
@@ -0,0 +1,88 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+# Give up on queued work if the box stays busier than this (1-min loadavg per core)
+MAX_LOAD_PER_CPU = 0.75
+BUSY_WAIT = 2.0
+
+
+class Prefetcher:
+    """
+    One low-priority daemon thread that warms caches for pages the user is
+    likely to open next.
+
+    Jobs are deduplicated by key and tagged with a generation; `submit(...,
+    replace=True)` bumps the generation so anything still queued for the
+    previous page is dropped. Warm functions receive a `cancelled()` callable
+    and should check it between units of work — it blocks briefly while live
+    requests are in flight and returns True when the job is stale or the host
+    is under load.
+    """
+
+    def __init__(self, inflight, max_pending=8):
+        self._inflight = inflight
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._thread = None
+
+    def submit(self, key, fn, *args, replace=False):
+        with self._lock:
+            if replace:
+                self._generation += 1
+                self._pending.clear()
+                try:
+                    while True:
+                        self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+            if key in self._pending:
+                return False
+            try:
+                self._queue.put_nowait((self._generation, key, fn, args))
+            except queue.Full:
+                return False
+            self._pending[key] = self._generation
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+                self._thread.start()
+        return True
+
+    def _stale(self, generation):
+        with self._lock:
+            return generation != self._generation
+
+    def _cancelled(self, generation):
+        deadline = time.monotonic() + BUSY_WAIT
+        while self._inflight() > 0:
+            if time.monotonic() > deadline or self._stale(generation):
+                return True
+            time.sleep(0.05)
+        try:
+            if os.getloadavg()[0] > MAX_LOAD_PER_CPU * (os.cpu_count() or 1):
+                return True
+        except OSError:
+            pass
+        return self._stale(generation)
+
+    def _run(self):
+        try:
+            # Linux threads are schedulable tasks — renice just this one
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            generation, key, fn, args = self._queue.get()
+            try:
+                if not self._cancelled(generation):
+                    fn(*args, cancelled=lambda: self._cancelled(generation))
+            except Exception as e:
+                logging.warning("Prefetch %s failed: %s", key, e)
+            finally:
+                with self._lock:
+                    if self._pending.get(key) == generation:
+                        del self._pending[key]
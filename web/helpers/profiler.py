@@ -0,0 +1,110 @@
+import glob
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Where finished dumps land — shared by every gunicorn worker in the pod
+PROFILE_DIR = '/tmp/gphoto-profiles'
+SAMPLE_INTERVAL = 0.005
+MAX_SECONDS = 120
+MAX_DUMPS = 20
+# How long past its sampling time a dump may still be pending before its worker is presumed dead
+PENDING_GRACE = 30
+
+_NAME_RE = re.compile(r'profile-\d+-\d+\.folded')
+
+_lock = threading.Lock()
+_running = None
+
+
+def _collapse(frame):
+    """Render a frame chain as a root-first `file:func:line;…` stack."""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+def _sample(seconds, out_path):
+    global _running
+    me = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline:
+            for tid, frame in sys._current_frames().items():
+                if tid != me:
+                    stacks[_collapse(frame)] += 1
+            time.sleep(SAMPLE_INTERVAL)
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        tmp_path = out_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp_path, out_path)
+        _prune()
+    finally:
+        try:
+            os.remove(out_path + '.pending')
+        except OSError:
+            pass
+        with _lock:
+            _running = None
+
+
+def _prune():
+    """Keep only the newest MAX_DUMPS finished dumps."""
+    dumps = sorted(glob.glob(os.path.join(PROFILE_DIR, '*.folded')), key=os.path.getmtime)
+    for path in dumps[:-MAX_DUMPS]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def start(seconds):
+    """
+    Sample every thread of this worker for `seconds` in the background.
+
+    A sync gunicorn worker can't profile itself while it's blocked answering the
+    request that asked for it, so sampling runs on a daemon thread and the
+    result is written as collapsed stacks (flamegraph.pl / speedscope input)
+    to PROFILE_DIR. Returns the dump's name, or None if a run is already active.
+    Until the dump is written a `.pending` marker stands in for it, so any
+    worker can tell "still sampling" from "no such profile".
+    """
+    global _running
+    seconds = max(1, min(int(seconds), MAX_SECONDS))
+    with _lock:
+        if _running is not None:
+            return None
+        name = f"profile-{os.getpid()}-{time.time_ns() // 1000000}.folded"
+        out_path = os.path.join(PROFILE_DIR, name)
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(out_path + '.pending', 'w') as f:
+            f.write(str(time.time() + seconds + PENDING_GRACE))
+        _running = threading.Thread(target=_sample, args=(seconds, out_path), daemon=True)
+        _running.start()
+    return name
+
+
+def result(name):
+    """(status, path) for a dump started by start(): 'done', 'pending' or 'missing'."""
+    if not _NAME_RE.fullmatch(name):
+        return 'missing', None
+    path = os.path.join(PROFILE_DIR, name)
+    if os.path.exists(path):
+        return 'done', path
+    try:
+        with open(path + '.pending') as f:
+            if time.time() < float(f.read()):
+                return 'pending', None
+    except (OSError, ValueError):
+        pass
+    return 'missing', None